@@ -0,0 +1,41 @@
+import os
+
+# ==========================
+# OUTPUT CODECS
+# ==========================
+
+# name -> (libsndfile format, subtype, extension, mimetype)
+OUTPUT_FORMATS = {
+    "wav": ("WAV", "PCM_16", ".wav", "audio/wav"),
+    "flac": ("FLAC", "PCM_16", ".flac", "audio/flac"),  # Lossless, roughly half the size
+    "opus": ("OGG", "OPUS", ".ogg", "audio/ogg"),  # Low bitrate; 8/12/16/24/48 kHz only
+    "vorbis": ("OGG", "VORBIS", ".ogg", "audio/ogg"),  # Low bitrate at any sample rate
+    "mp3": ("MP3", "MPEG_LAYER_III", ".mp3", "audio/mpeg"),
+}
+
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Every extension a rendered session may have, for folder listings
+AUDIO_EXTENSIONS = tuple(sorted({spec[2] for spec in OUTPUT_FORMATS.values()}))
+
+def output_format(name, sr=None):
+    """``(format, subtype, ext)`` for an output codec name.
+
+    Raises ``ValueError`` for unknown names, and for Opus at a sample rate
+    the codec can't encode (use ``"vorbis"`` there instead).
+    """
+    try:
+        format, subtype, ext, _ = OUTPUT_FORMATS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown output format {name!r}, expected one of {sorted(OUTPUT_FORMATS)}")
+    if subtype == "OPUS" and sr is not None and sr not in OPUS_RATES:
+        raise ValueError(f"Opus can't encode {sr} Hz audio, expected one of {OPUS_RATES}")
+    return format, subtype, ext
+
+def mimetype_for(path):
+    """Content type for a rendered file, from its extension."""
+    ext = os.path.splitext(path)[1].lower()
+    for _, _, format_ext, mimetype in OUTPUT_FORMATS.values():
+        if format_ext == ext:
+            return mimetype
+    return "application/octet-stream"
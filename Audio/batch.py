@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import soundfile as sf
+import main
+from clip_library import ClipLibrary
+from audio_formats import output_format
+from seeding import spawn_seeds
+
+# ==========================
+# BATCH RENDERING
+# ==========================
+
+# Manifest job keys; everything but "count" is passed to generate_audio_job
+JOB_KEYS = ("user", "bg_noise", "duration", "seed", "format", "count")
+
+def load_manifest(path):
+    """``(jobs, seed)`` from a JSON manifest.
+
+    The manifest is a list of job objects, or ``{"seed": ..., "jobs": [...]}``.
+    A job may set ``user``, ``bg_noise``, ``duration`` (seconds), ``seed``,
+    ``format`` and ``count`` (sessions to render with those settings).
+    """
+    with open(path) as fh:
+        data = json.load(fh)
+    if isinstance(data, list):
+        data = {"jobs": data}
+    return data.get("jobs", []), data.get("seed")
+
+def expand_jobs(jobs, seed=None):
+    """One dict per session, with ``count`` expanded and missing seeds spawned from ``seed``."""
+    expanded = []
+    for job in jobs:
+        unknown = set(job) - set(JOB_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown job keys {sorted(unknown)} in {job}")
+        output_format(job.get("format") or main.OUTPUT_FORMAT, main.SR)  # Fail before rendering
+        for _ in range(int(job.get("count", 1))):
+            expanded.append({key: job.get(key) for key in JOB_KEYS if key != "count"})
+
+    unseeded = [job for job in expanded if job["seed"] is None]
+    for job, job_seed in zip(unseeded, spawn_seeds(seed, len(unseeded))):
+        job["seed"] = job_seed
+    return expanded
+
+def _init_worker(layout):
+    # Zero-copy views over the parent's shared clip block
+    main.CLIPS = ClipLibrary.attach_shared(layout, main.CLIP_CACHE_MAX_BYTES)
+
+def _render(number, job):
+    start = time.perf_counter()
+    path = main.generate_audio_job(
+        job["bg_noise"],
+        number,
+        job["seed"],
+        codec=job["format"],
+        user=job["user"],
+        duration=job["duration"],
+    )
+    return path, sf.info(path).duration, time.perf_counter() - start
+
+def summarize(results, wall_seconds):
+    done = [result for result in results if result["error"] is None]
+    audio_hours = sum(result["audio_seconds"] for result in done) / 3600
+    wall_minutes = wall_seconds / 60
+    return {
+        "sessions": len(done),
+        "failed": len(results) - len(done),
+        "audio_hours": round(audio_hours, 3),
+        "wall_minutes": round(wall_minutes, 3),
+        "audio_hours_per_minute": round(audio_hours / wall_minutes, 3) if wall_minutes > 0 else None,
+    }
+
+def run_batch(jobs, max_workers=None, seed=None):
+    """Render manifest ``jobs`` on a process pool; returns ``(results, summary)``.
+
+    Clips are decoded once in this process and shared with every worker
+    through one ``SharedMemory`` block; noise beds are memory-mapped from
+    the PCM cache, which is filled here first. Longer jobs are submitted
+    first so a long session doesn't start last and run alone.
+    """
+    jobs = expand_jobs(jobs, seed)
+    start = time.perf_counter()
+
+    for bg_noise in {job["bg_noise"] or main.render_plan(job["user"] or main.USER_NAME).bg_noise for job in jobs}:
+        main.load_noise_bed(bg_noise)
+    shm, layout = main.CLIPS.export_shared(main.ROUND_SEQUENCE)
+
+    def expected_seconds(index):
+        duration = jobs[index]["duration"]
+        return duration if duration is not None else main.BASE_DURATION_SECONDS + main.EXTRA_DURATION_MAX
+
+    results = []
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(layout,),
+        ) as pool:
+            order = sorted(range(len(jobs)), key=expected_seconds, reverse=True)
+            futures = {pool.submit(_render, index + 1, jobs[index]): index for index in order}
+            for future in as_completed(futures):
+                job = jobs[futures[future]]
+                result = {"job": job, "path": None, "audio_seconds": 0.0, "render_seconds": None, "error": None}
+                try:
+                    result["path"], result["audio_seconds"], result["render_seconds"] = future.result()
+                    print(f"[{len(results) + 1}/{len(jobs)}] {result['path']} "
+                          f"({result['audio_seconds'] / 60:.1f} min in {result['render_seconds']:.1f}s)")
+                except Exception as e:
+                    result["error"] = repr(e)
+                    print(f"[{len(results) + 1}/{len(jobs)}] {job} FAILED: {e!r}")
+                results.append(result)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return results, summarize(results, time.perf_counter() - start)
+
+# ==========================
+# MAIN
+# ==========================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render every session in a JSON manifest.")
+    parser.add_argument("manifest", help="JSON list of jobs, or {\"seed\": ..., \"jobs\": [...]}")
+    parser.add_argument("--workers", type=int, default=main.MAX_WORKERS, help="worker processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, help="run seed for jobs without one (overrides the manifest's)")
+    args = parser.parse_args()
+
+    jobs, manifest_seed = load_manifest(args.manifest)
+    results, summary = run_batch(jobs, args.workers, args.seed if args.seed is not None else manifest_seed)
+
+    print(f"\n{summary['sessions']} sessions ({summary['failed']} failed): "
+          f"{summary['audio_hours']:.2f} audio hours in {summary['wall_minutes']:.1f} min "
+          f"= {summary['audio_hours_per_minute']} audio hours per minute")
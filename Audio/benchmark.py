@@ -0,0 +1,121 @@
+import time
+import numpy as np
+import librosa
+from timeline import Timeline
+from dsp import ClipFX
+
+# ==========================
+# CONFIG
+# ==========================
+
+SR = 8000
+SESSION_SECONDS = 20 * 60  # Synthetic session length per benchmark
+CLIP_SECONDS = (0.8, 3.0)  # Random clip length range
+PAUSE_SECONDS = (0.05, 1.2)  # Random pause length range
+SEED = 1234
+
+# ==========================
+# HELPERS
+# ==========================
+
+def make_events(seconds, seed=SEED):
+    """Build a fixed list of ("clip", array) / ("silence", samples) events."""
+    rng = np.random.default_rng(seed)
+    events = []
+    total = 0
+    while total < seconds * SR:
+        clip = rng.uniform(-0.5, 0.5, int(rng.uniform(*CLIP_SECONDS) * SR)).astype(np.float32)
+        pause = int(rng.uniform(*PAUSE_SECONDS) * SR)
+        events.append(("clip", clip))
+        events.append(("silence", pause))
+        total += len(clip) + pause
+    return events
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def report(name, baseline, candidate):
+    speedup = baseline / candidate if candidate > 0 else float("inf")
+    print(f"{name:<24} baseline {baseline:8.3f}s   new {candidate:8.3f}s   x{speedup:.1f}")
+
+# ==========================
+# TIMELINE
+# ==========================
+
+def render_concatenate(events):
+    audio = np.array([], dtype=np.float32)
+    for kind, value in events:
+        if kind == "clip":
+            audio = np.concatenate([audio, value])
+        else:
+            audio = np.concatenate([audio, np.zeros(value)])
+    return audio
+
+def render_timeline(events, seconds):
+    timeline = Timeline(seconds * SR)
+    for kind, value in events:
+        if kind == "clip":
+            timeline.append(value)
+        else:
+            timeline.append_silence(value)
+    return timeline.to_array()
+
+def bench_timeline():
+    events = make_events(SESSION_SECONDS)
+    old, old_time = timed(render_concatenate, events)
+    new, new_time = timed(render_timeline, events, SESSION_SECONDS)
+    assert np.array_equal(old, new), "timeline output differs from concatenate"
+    report("timeline append", old_time, new_time)
+
+# ==========================
+# CLIP FX CHAIN
+# ==========================
+
+def make_fx_params(events, seed=SEED):
+    rng = np.random.default_rng(seed + 1)
+    params = []
+    for kind, clip in events:
+        if kind != "clip":
+            continue
+        fade_end = rng.uniform(0.7, 0.9) if rng.random() < 0.25 else None
+        params.append((clip, 10 ** (rng.uniform(-1.0, 1.5) * 0.4 / 20), fade_end))
+    return params
+
+def fx_separate_passes(params):
+    # The chain main.py/test.py used before: one array op per effect
+    out = []
+    for clip, gain, fade_end in params:
+        audio = clip.copy()
+        audio *= 0.9
+        audio = librosa.effects.preemphasis(audio, coef=0.85)
+        if fade_end is not None:
+            audio *= np.linspace(1.0, fade_end, len(audio))
+        audio *= gain
+        audio = librosa.effects.preemphasis(audio, coef=0.93)
+        out.append(np.clip(audio, -0.8, 0.8))
+    return np.concatenate(out)
+
+def fx_fused(params):
+    fx = ClipFX(preemphasis=0.93, soften=(0.9, 0.85), limit=0.8)
+    out = np.empty(sum(len(clip) for clip, _, _ in params), dtype=np.float32)
+    fx.render_many(params, out)
+    return out
+
+def bench_clip_fx():
+    params = make_fx_params(make_events(SESSION_SECONDS))
+    fx_separate_passes(params[:2])  # Pay librosa's lazy imports up front
+    old, old_time = timed(fx_separate_passes, params)
+    new, new_time = timed(fx_fused, params)
+    assert np.allclose(old, new, atol=1e-5), "fused FX chain differs from separate passes"
+    report("clip fx chain", old_time, new_time)
+
+# ==========================
+# MAIN
+# ==========================
+
+if __name__ == "__main__":
+    print(f"Synthetic session: {SESSION_SECONDS / 60:.0f} min @ {SR} Hz\n")
+    bench_timeline()
+    bench_clip_fx()
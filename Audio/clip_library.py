@@ -0,0 +1,170 @@
+import os
+import random
+from collections import OrderedDict
+from multiprocessing import shared_memory
+import numpy as np
+import pcm_cache
+from clip_pack import ClipPack
+
+# ==========================
+# CLIP LIBRARY
+# ==========================
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # Decoded-clip budget per process (512 MB)
+
+class ClipLibrary:
+    """Decoded clips from ``<root>/<category>/``, scanned and decoded once.
+
+    Folder listings are cached for the life of the object. Decoded clips are
+    kept in an LRU cache bounded by ``max_bytes``; cached arrays are marked
+    read-only, so callers that modify a clip must copy it first.
+
+    If ``root`` holds a clip pack for ``sr`` (see ``clip_pack.py``), the
+    categories it contains are listed from its index and their clips are
+    slices of its memory map instead of decoded files. A category whose
+    folder changed since the pack was built is read from the folder
+    instead, with a warning to rebuild.
+
+    ``export_shared`` packs decoded categories into one shared-memory block
+    and ``attach_shared`` builds a library of zero-copy views over it, so a
+    pool of worker processes holds the clips in RAM only once.
+    """
+
+    def __init__(self, root, sr, extensions=(".mp3",), max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.sr = sr
+        self.extensions = tuple(extensions)
+        self.max_bytes = max_bytes
+        self._files = {}
+        self._clips = OrderedDict()
+        self._bytes = 0
+        self._pinned = {}  # (category, name) -> view into shared memory
+        self._shared = None
+        self._pack = ClipPack.open(root, sr)
+        self._packed = {}  # category -> whether the pack is current for it
+
+    def _from_pack(self, category):
+        if self._pack is None:
+            return False
+        if category not in self._packed:
+            current = bool(self._pack.names(category))
+            if current and not self._pack.matches_folder(category, os.path.join(self.root, category), self.extensions):
+                print(f"[CLIPS] {category}/ changed since the clip pack was built; reading the folder "
+                      f"(rebuild: python clip_pack.py {self.root} --sr {self.sr})")
+                current = False
+            self._packed[category] = current
+        return self._packed[category]
+
+    def files(self, category):
+        """Sorted clip filenames in a category (empty if the folder is missing)."""
+        if category not in self._files:
+            if self._from_pack(category):
+                self._files[category] = [n for n in self._pack.names(category) if n.endswith(self.extensions)]
+                return self._files[category]
+            folder = os.path.join(self.root, category)
+            if os.path.isdir(folder):
+                names = sorted(f for f in os.listdir(folder) if f.endswith(self.extensions))
+            else:
+                names = []
+            self._files[category] = names
+        return self._files[category]
+
+    def load(self, category, name):
+        key = (category, name)
+        audio = self._pinned.get(key)
+        if audio is not None:
+            return audio
+        packed = self._from_pack(category) and key in self._pack
+        if packed and self._pack.dtype == "float32":
+            return self._pack.load(category, name)  # Already a read-only mapped view
+        audio = self._clips.get(key)
+        if audio is not None:
+            self._clips.move_to_end(key)
+            return audio
+
+        if packed:
+            audio = self._pack.load(category, name)
+        else:
+            audio, _ = pcm_cache.load(os.path.join(self.root, category, name), self.sr)
+        audio.flags.writeable = False
+        self._clips[key] = audio
+        self._bytes += audio.nbytes
+        self._evict()
+        return audio
+
+    def random_clip(self, category, rng=random, names=None):
+        """Pick and decode a random clip; returns ``(name, audio)`` or ``None``.
+
+        ``names`` restricts the pick to a subset of the category's files.
+        """
+        if names is None:
+            names = self.files(category)
+        if not names:
+            return None
+        name = rng.choice(names)
+        return name, self.load(category, name)
+
+    def preload(self, categories):
+        """Decode every clip in the given categories up front."""
+        for category in categories:
+            for name in self.files(category):
+                self.load(category, name)
+
+    def _evict(self):
+        # Always keep the most recent clip, even if it alone exceeds the budget
+        while self._bytes > self.max_bytes and len(self._clips) > 1:
+            _, audio = self._clips.popitem(last=False)
+            self._bytes -= audio.nbytes
+
+    def export_shared(self, categories):
+        """Decode ``categories`` into one ``SharedMemory`` block.
+
+        Returns ``(shm, layout)``. Pass the picklable ``layout`` to
+        ``attach_shared`` in other processes; the caller owns ``shm`` and
+        must ``close()`` and ``unlink()`` it once they are done.
+        """
+        entries = []
+        total = 0
+        for category in sorted(set(categories)):
+            for name in self.files(category):
+                audio = self.load(category, name)
+                entries.append((category, name, total, len(audio)))
+                total += len(audio)
+
+        shm = shared_memory.SharedMemory(create=True, size=max(total, 1) * 4)
+        block = np.ndarray(total, dtype=np.float32, buffer=shm.buf)
+        for category, name, offset, length in entries:
+            block[offset : offset + length] = self.load(category, name)
+        del block  # No exported views may outlive a later shm.close()
+
+        layout = {
+            "shm_name": shm.name,
+            "root": self.root,
+            "sr": self.sr,
+            "extensions": self.extensions,
+            "files": {category: list(self.files(category)) for category in sorted(set(categories))},
+            "clips": entries,
+        }
+        return shm, layout
+
+    @classmethod
+    def attach_shared(cls, layout, max_bytes=DEFAULT_MAX_BYTES):
+        """Library whose exported clips are read-only views of the shared block.
+
+        Categories that were not exported still load from disk as usual.
+        """
+        library = cls(layout["root"], layout["sr"], layout["extensions"], max_bytes)
+        try:
+            shm = shared_memory.SharedMemory(name=layout["shm_name"], track=False)
+        except TypeError:
+            # Python < 3.13 always tracks; pool workers share the creator's
+            # resource tracker, so the block is still only unlinked once
+            shm = shared_memory.SharedMemory(name=layout["shm_name"])
+        total = sum(length for _, _, _, length in layout["clips"])
+        block = np.ndarray(total, dtype=np.float32, buffer=shm.buf)
+        block.flags.writeable = False
+        for category, name, offset, length in layout["clips"]:
+            library._pinned[(category, name)] = block[offset : offset + length]
+        library._files.update(layout["files"])
+        library._shared = shm  # Keeps the mapping alive as long as the views
+        return library
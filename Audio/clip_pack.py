@@ -0,0 +1,367 @@
+import os
+import json
+import hashlib
+import argparse
+import tempfile
+import numpy as np
+from scipy.signal import lfilter
+import pcm_cache
+
+# ==========================
+# CLIP PACKS
+# ==========================
+
+# A pack is two files in a clip folder, one pair per sample rate:
+#   clips-<sr>.pcm   every clip's samples back to back (raw float32 or int16)
+#   clips-<sr>.json  {"sr", "dtype", "meta", "clips": [{name, category, offset, length, <stats>}]}
+# Offsets and lengths are in samples; the stats (rms, peak, duration and,
+# when measured, lufs) are taken once when the clip is added. A variant
+# pack (clips-<sr>-<variant>.*) holds processed copies of another pack's
+# clips, see ``derived_pack``. The data file is only ever appended
+# to (or rewritten under a new inode when compacted), so a reader's memory
+# map stays valid while the index is replaced.
+
+PACK_DTYPES = ("float32", "int16")
+INT16_SCALE = 32768.0
+SKIP_CATEGORIES = ("bg_noise",)  # Folders ``build`` leaves out (noise beds load through pcm_cache)
+
+def folder_state(folder, extensions):
+    """``{name: [size, mtime_ns]}`` of the clip files in ``folder``."""
+    state = {}
+    if os.path.isdir(folder):
+        for entry in os.scandir(folder):
+            if entry.name.endswith(tuple(extensions)) and entry.is_file():
+                st = entry.stat()
+                state[entry.name] = [st.st_size, st.st_mtime_ns]
+    return state
+
+def pack_paths(root, sr, variant=None):
+    """``(data_path, index_path)`` of the pack for ``sr`` in ``root``."""
+    stem = f"clips-{sr}-{variant}" if variant else f"clips-{sr}"
+    return os.path.join(root, f"{stem}.pcm"), os.path.join(root, f"{stem}.json")
+
+# ==========================
+# CLIP STATS
+# ==========================
+
+LUFS_BLOCK = 0.4  # BS.1770 gating block (seconds), 75% overlap
+LUFS_ABS_GATE = -70.0
+LUFS_REL_GATE = -10.0
+
+def clip_rms(audio):
+    return float(np.sqrt(np.mean(np.square(audio, dtype=np.float64)))) if len(audio) else 0.0
+
+def _biquad(kind, sr, f0, q, gain_db=0.0):
+    # RBJ cookbook high shelf / high pass, as used for BS.1770's K-weighting
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * f0 / sr
+    alpha = np.sin(w0) / (2 * q)
+    cos = np.cos(w0)
+    if kind == "high_shelf":
+        b = [a * ((a + 1) + (a - 1) * cos + 2 * np.sqrt(a) * alpha),
+             -2 * a * ((a - 1) + (a + 1) * cos),
+             a * ((a + 1) + (a - 1) * cos - 2 * np.sqrt(a) * alpha)]
+        den = [(a + 1) - (a - 1) * cos + 2 * np.sqrt(a) * alpha,
+               2 * ((a - 1) - (a + 1) * cos),
+               (a + 1) - (a - 1) * cos - 2 * np.sqrt(a) * alpha]
+    else:
+        b = [(1 + cos) / 2, -(1 + cos), (1 + cos) / 2]
+        den = [1 + alpha, -2 * cos, 1 - alpha]
+    return np.array(b) / den[0], np.array(den) / den[0]
+
+def integrated_lufs(audio, sr):
+    """Gated integrated loudness (ITU-R BS.1770) of a mono clip, or ``None``.
+
+    Clips shorter than one gating block, or entirely below the absolute
+    gate, have no defined loudness.
+    """
+    block = int(LUFS_BLOCK * sr)
+    if len(audio) < block:
+        return None
+    y = np.asarray(audio, dtype=np.float64)
+    y = lfilter(*_biquad("high_shelf", sr, 1500.0, 1 / np.sqrt(2), 4.0), y)
+    y = lfilter(*_biquad("high_pass", sr, 38.0, 0.5), y)
+    energy = np.concatenate([[0.0], np.cumsum(y * y)])
+    starts = np.arange(0, len(y) - block + 1, block // 4)
+    z = (energy[starts + block] - energy[starts]) / block
+    z = z[-0.691 + 10 * np.log10(np.maximum(z, 1e-20)) > LUFS_ABS_GATE]
+    if not len(z):
+        return None
+    z = z[-0.691 + 10 * np.log10(np.maximum(z, 1e-20)) > -0.691 + 10 * np.log10(z.mean()) + LUFS_REL_GATE]
+    return float(-0.691 + 10 * np.log10(z.mean()))
+
+def clip_stats(audio, sr, lufs=False):
+    """Index stats for one clip: rms, peak, duration (seconds) and optionally lufs."""
+    stats = {
+        "rms": clip_rms(audio),
+        "peak": float(np.max(np.abs(audio))) if len(audio) else 0.0,
+        "duration": len(audio) / sr,
+    }
+    if lufs:
+        stats["lufs"] = integrated_lufs(audio, sr)
+    return stats
+
+# ==========================
+# READING AND WRITING
+# ==========================
+
+class ClipPack:
+    """Read-only view of a pack; ``load`` slices the memory-mapped data.
+
+    Float32 packs hand out zero-copy read-only views; int16 packs are
+    scaled to float32 on load, which copies.
+    """
+
+    def __init__(self, data_path, index):
+        self.sr = index["sr"]
+        self.dtype = index["dtype"]
+        self.meta = index.get("meta", {})
+        self.entries = {(clip["category"], clip["name"]): clip for clip in index["clips"]}
+        self._names = {}
+        for clip in index["clips"]:
+            self._names.setdefault(clip["category"], []).append(clip["name"])
+        for names in self._names.values():
+            names.sort()
+        size = os.path.getsize(data_path) // np.dtype(self.dtype).itemsize
+        self._data = np.memmap(data_path, dtype=self.dtype, mode="r", shape=(size,)) if size else np.zeros(0, self.dtype)
+
+    @classmethod
+    def open(cls, root, sr, variant=None):
+        """The pack for ``sr`` in ``root``, or ``None`` if there is none."""
+        data_path, index_path = pack_paths(root, sr, variant)
+        try:
+            with open(index_path) as fh:
+                index = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(data_path):
+            return None
+        return cls(data_path, index)
+
+    def categories(self):
+        return sorted(self._names)
+
+    def names(self, category):
+        """Sorted clip names in ``category`` (empty if it isn't packed)."""
+        return self._names.get(category, [])
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def matches_folder(self, category, folder, extensions):
+        """Whether ``category``'s clips still match the files in ``folder``.
+
+        Packs made by ``build`` record each source file's size and mtime;
+        a file added, removed or replaced since makes the category stale.
+        Only files with ``extensions`` are compared. Packs without that
+        record (e.g. splitter's) are taken as current.
+        """
+        recorded = self.meta.get("folders", {}).get(category)
+        if recorded is None:
+            return True
+        recorded = {name: state for name, state in recorded.items() if name.endswith(tuple(extensions))}
+        return folder_state(folder, extensions) == recorded
+
+    def stats(self, category, name):
+        """The clip's index entry, with stats missing from older packs filled in."""
+        clip = self.entries[(category, name)]
+        if "peak" not in clip:
+            clip.update(clip_stats(self.load(category, name), self.sr))
+        return clip
+
+    def load(self, category, name):
+        clip = self.entries[(category, name)]
+        audio = self._data[clip["offset"] : clip["offset"] + clip["length"]]
+        if self.dtype == "int16":
+            return (audio / np.float32(INT16_SCALE)).astype(np.float32)
+        return audio
+
+class PackWriter:
+    """Appends clips to the pack for ``sr`` in ``root``.
+
+    With ``append``, an existing pack with the same ``sr`` and ``dtype``
+    is extended; anything else there is replaced. Nothing is visible to
+    readers until ``save``, which writes the index atomically. Space left
+    by removed clips is reclaimed once it outweighs the live clips. Each
+    added clip's stats are measured on the way in (``lufs`` adds the
+    integrated loudness, which costs a filter pass per clip).
+    """
+
+    def __init__(self, root, sr, dtype="float32", append=True, variant=None, lufs=False):
+        if dtype not in PACK_DTYPES:
+            raise ValueError(f"Unsupported pack dtype {dtype!r} (choose from {', '.join(PACK_DTYPES)})")
+        self.root = root
+        self.sr = sr
+        self.dtype = dtype
+        self.lufs = lufs
+        self.meta = {}  # Saved with the index, e.g. what a variant was built from
+        self.data_path, self.index_path = pack_paths(root, sr, variant)
+        self.clips = self._existing_clips() if append else []
+        if self.clips:
+            # Drop bytes past the last indexed clip (a run that never saved)
+            self._end = max(clip["offset"] + clip["length"] for clip in self.clips)
+            self._data = open(self.data_path, "r+b")
+            self._data.truncate(self._end * np.dtype(dtype).itemsize)
+            self._data.seek(0, os.SEEK_END)
+        else:
+            self._end = 0
+            if os.path.exists(self.data_path):
+                os.remove(self.data_path)  # Readers keep their map of the old file
+            self._data = open(self.data_path, "wb")
+
+    def _existing_clips(self):
+        try:
+            with open(self.index_path) as fh:
+                index = json.load(fh)
+        except (OSError, ValueError):
+            return []
+        if (index["sr"], index["dtype"]) != (self.sr, self.dtype) or not os.path.exists(self.data_path):
+            return []
+        return index["clips"]
+
+    def add(self, name, category, audio, stats=None):
+        """Append one clip; returns its index entry.
+
+        ``stats`` from ``clip_stats`` may be passed in when they were
+        already measured elsewhere (e.g. in a worker process).
+        """
+        audio = np.asarray(audio, dtype=np.float32)
+        if self.dtype == "int16":
+            samples = np.clip(np.round(audio * INT16_SCALE), -INT16_SCALE, INT16_SCALE - 1).astype(np.int16)
+        else:
+            samples = audio
+        self._data.write(samples.tobytes())
+        clip = {"name": name, "category": category, "offset": self._end, "length": len(audio),
+                **(stats if stats is not None else clip_stats(audio, self.sr, self.lufs))}
+        self._end += len(audio)
+        self.clips.append(clip)
+        return clip
+
+    def remove(self, names):
+        names = set(names)
+        self.clips = [clip for clip in self.clips if clip["name"] not in names]
+
+    def _compact(self):
+        itemsize = np.dtype(self.dtype).itemsize
+        self._data.flush()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".clips", suffix=".tmp")
+        os.chmod(tmp_path, 0o644)  # mkstemp files are private to this user
+        with os.fdopen(fd, "wb") as out, open(self.data_path, "rb") as src:
+            offset = 0
+            for clip in self.clips:
+                src.seek(clip["offset"] * itemsize)
+                out.write(src.read(clip["length"] * itemsize))
+                clip["offset"] = offset
+                offset += clip["length"]
+        self._data.close()
+        os.replace(tmp_path, self.data_path)  # Open maps keep the old file
+        self._end = offset
+        self._data = open(self.data_path, "r+b")
+        self._data.seek(0, os.SEEK_END)
+
+    def save(self):
+        live = sum(clip["length"] for clip in self.clips)
+        if self._end - live > live:
+            self._compact()
+        self._data.flush()
+        os.fsync(self._data.fileno())  # Data before the index that points at it
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".clips", suffix=".tmp")
+        os.chmod(tmp_path, 0o644)  # Readable by other users' generators, like the data file
+        with os.fdopen(fd, "w") as fh:
+            json.dump({"sr": self.sr, "dtype": self.dtype, "meta": self.meta, "clips": self.clips}, fh)
+        os.replace(tmp_path, self.index_path)
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def build(root, sr, extensions=(".mp3", ".wav"), dtype="float32", lufs=False):
+    """Pack every ``<root>/<category>/<clip>`` decoded at ``sr``; returns the clip count.
+
+    Clips keep their file names, so profile clip subsets still apply.
+    Each folder's file sizes and mtimes are recorded, so ``ClipLibrary``
+    notices when a folder changes and reads it directly until the pack
+    is rebuilt.
+    """
+    count = 0
+    with PackWriter(root, sr, dtype, append=False, lufs=lufs) as writer:
+        folders = {}
+        for category in sorted(os.listdir(root)):
+            folder = os.path.join(root, category)
+            if not os.path.isdir(folder) or category.startswith(".") or category in SKIP_CATEGORIES:
+                continue
+            folders[category] = folder_state(folder, extensions)
+            for name in sorted(folders[category]):
+                audio, _ = pcm_cache.load(os.path.join(folder, name), sr)
+                writer.add(name, category, audio)
+                count += 1
+        writer.meta = {"folders": folders}
+        writer.save()
+    return count
+
+def _digest(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+def derived_pack(root, sr, name, params, process):
+    """``root``'s pack for ``sr`` with every clip passed through ``process``.
+
+    ``process(audio, clip)`` also gets the clip's index entry, so it can
+    use the stats measured at ingest instead of recomputing them.
+
+    The result is stored as the variant ``<name>-<hash of params>`` and
+    reused until the source pack's index or ``params`` change, so the
+    processing runs once per clip instead of every time a clip is used.
+    Older variants of ``name`` are deleted. ``params`` must describe
+    everything ``process`` depends on. Returns ``None`` if there is no
+    source pack.
+    """
+    _, source_index = pack_paths(root, sr)
+    try:
+        with open(source_index, "rb") as fh:
+            source_key = hashlib.sha1(fh.read()).hexdigest()
+    except OSError:
+        return None
+    variant = f"{name}-{_digest(params)}"
+    derived = ClipPack.open(root, sr, variant)
+    if derived is not None and derived.meta.get("source") == source_key:
+        return derived
+
+    source = ClipPack.open(root, sr)
+    if source is None:
+        return None
+    with PackWriter(root, sr, append=False, variant=variant) as writer:
+        for category, clip_name in sorted(source.entries):
+            writer.add(clip_name, category, process(source.load(category, clip_name), source.stats(category, clip_name)))
+        writer.meta = {"source": source_key, "params": params}
+        writer.save()
+
+    prefix = f"clips-{sr}-{name}-"
+    keep = set(map(os.path.basename, pack_paths(root, sr, variant)))
+    for stale in os.listdir(root):
+        if stale.startswith(prefix) and stale not in keep:
+            try:
+                os.remove(os.path.join(root, stale))
+            except OSError:
+                pass
+    return ClipPack.open(root, sr, variant)
+
+# ==========================
+# MAIN
+# ==========================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack a clip folder's <category>/<clip> files into one clip pack.")
+    parser.add_argument("root", help="clip folder, e.g. voices")
+    parser.add_argument("--sr", type=int, required=True, help="sample rate the generator renders at")
+    parser.add_argument("--dtype", choices=PACK_DTYPES, default="float32", help="sample storage (int16 halves the size)")
+    parser.add_argument("--ext", action="append", help="clip extensions to include (default: .mp3 and .wav)")
+    parser.add_argument("--lufs", action="store_true", help="also measure each clip's integrated loudness")
+    args = parser.parse_args()
+
+    count = build(args.root, args.sr, tuple(args.ext or (".mp3", ".wav")), args.dtype, args.lufs)
+    print(f"Packed {count} clips into {pack_paths(args.root, args.sr)[0]}")
@@ -0,0 +1,151 @@
+import numpy as np
+
+# ==========================
+# BLOCK-WISE MIXING
+# ==========================
+
+MIX_BLOCK = 1 << 16  # Samples processed per block (~8 s at 8 kHz)
+
+def mix_looped_noise(speech, noise, level, end_level=None, offset=0, block=MIX_BLOCK):
+    """Add ``noise`` looped to the length of ``speech`` into ``speech`` in place.
+
+    The noise bed is never tiled: each block reads the matching slice of
+    ``noise`` by index arithmetic, so ``noise`` can be a memory map and the
+    extra memory is one block. ``level`` is the noise gain; with
+    ``end_level`` it ramps linearly from ``level`` to ``end_level`` across
+    ``speech``. ``offset`` is the noise position of ``speech[0]``, for mixing
+    a long session in several calls.
+    """
+    total = len(speech)
+    loop = len(noise)
+    if total == 0 or loop == 0:
+        return speech
+
+    scratch = np.empty(min(block, total), dtype=speech.dtype)
+    if end_level is not None:
+        step = (end_level - level) / (total - 1) if total > 1 else 0.0
+        index = np.arange(len(scratch), dtype=np.float64)
+        ramp = np.empty(len(scratch), dtype=np.float64)
+
+    pos = 0
+    while pos < total:
+        start = (offset + pos) % loop
+        count = min(block, total - pos, loop - start)
+        out = speech[pos : pos + count]
+
+        if end_level is None:
+            np.multiply(noise[start : start + count], level, out=scratch[:count])
+        else:
+            np.add(index[:count], pos, out=ramp[:count])
+            ramp[:count] *= step
+            ramp[:count] += level
+            np.multiply(noise[start : start + count], ramp[:count], out=scratch[:count], casting="unsafe")
+        np.add(out, scratch[:count], out=out)
+        pos += count
+
+    return speech
+
+def peak_abs(audio, block=MIX_BLOCK):
+    """Largest absolute sample, scanned one block at a time."""
+    peak = 0.0
+    for pos in range(0, len(audio), block):
+        chunk = audio[pos : pos + block]
+        if len(chunk):
+            peak = max(peak, float(np.max(chunk)), -float(np.min(chunk)))
+    return peak
+
+def normalize_peak(audio, peak, target, block=MIX_BLOCK):
+    """In place ``audio = audio / peak * target``, one block at a time."""
+    if peak <= 0:
+        return audio
+    for pos in range(0, len(audio), block):
+        chunk = audio[pos : pos + block]
+        np.divide(chunk, peak, out=chunk)
+        np.multiply(chunk, target, out=chunk)
+    return audio
+
+# ==========================
+# FUSED CLIP FX
+# ==========================
+
+def preemphasis(audio, coef, out):
+    """``librosa.effects.preemphasis`` written into ``out`` without temporaries.
+
+    Matches librosa's default initial state, so ``out[0] = 3*x[0] - x[1]``.
+    ``out`` must not overlap ``audio``.
+    """
+    if len(audio) < 2:
+        out[:] = audio
+        return out
+    np.multiply(audio[:-1], -coef, out=out[1:])
+    np.add(out[1:], audio[1:], out=out[1:])
+    out[0] = 3 * audio[0] - audio[1]
+    return out
+
+class ClipFX:
+    """Per-clip voice chain fused into a few in-place float32 passes.
+
+    Applies, in order: optional softening (gain then preemphasis), a linear
+    fade from 1.0 to ``fade_end``, a gain, the mic-colour preemphasis and an
+    optional hard limiter, which is the same order as the old chain of
+    separate array operations. Output goes straight into the caller's
+    buffer (usually a slice claimed from a Timeline). Scratch buffers are
+    allocated once and reused for every clip.
+    """
+
+    def __init__(self, preemphasis=0.93, soften=None, limit=None):
+        self.preemphasis = preemphasis
+        self.soften = soften  # (gain, preemphasis coef) or None
+        self.limit = limit
+        self._work = np.empty(0, dtype=np.float32)
+        self._env = np.empty(0, dtype=np.float32)
+        self._ramp = np.empty(0, dtype=np.float32)
+
+    def _buffers(self, n):
+        if len(self._work) < n:
+            size = max(n, int(len(self._work) * 1.5))
+            self._work = np.empty(size, dtype=np.float32)
+            self._env = np.empty(size, dtype=np.float32)
+            self._ramp = np.arange(size, dtype=np.float32)
+        return self._work[:n], self._env[:n]
+
+    def render(self, clip, out, gain=1.0, fade_end=None):
+        """Process ``clip`` into ``out`` (same length); ``clip`` is not modified."""
+        n = len(clip)
+        if n == 0:
+            return out
+        work, env = self._buffers(n)
+
+        src = clip
+        if self.soften is not None:
+            soften_gain, soften_coef = self.soften
+            preemphasis(clip, soften_coef, out=work)
+            gain *= soften_gain
+            src = work
+
+        if fade_end is None:
+            np.multiply(src, gain, out=work)
+        else:
+            # env = gain * linspace(1.0, fade_end, n)
+            step = (fade_end - 1.0) / (n - 1) if n > 1 else 0.0
+            np.multiply(self._ramp[:n], step * gain, out=env)
+            env += gain
+            np.multiply(src, env, out=work)
+
+        preemphasis(work, self.preemphasis, out=out)
+        if self.limit is not None:
+            np.clip(out, -self.limit, self.limit, out=out)
+        return out
+
+    def render_many(self, clips, out):
+        """Render ``(clip, gain, fade_end)`` items back to back into ``out``.
+
+        Returns the end offset of each clip in ``out``.
+        """
+        ends = []
+        pos = 0
+        for clip, gain, fade_end in clips:
+            self.render(clip, out[pos : pos + len(clip)], gain, fade_end)
+            pos += len(clip)
+            ends.append(pos)
+        return ends
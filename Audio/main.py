@@ -1,11 +1,16 @@
 import time
-import random
 import os
-import numpy as np
-import librosa
-import soundfile as sf
-import re
-from multiprocessing import Process
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from timeline import Timeline
+from clip_library import ClipLibrary
+import pcm_cache
+from dsp import mix_looped_noise, peak_abs, normalize_peak
+from session_writer import SessionWriter, LivePreview
+from output_naming import reserve_output, part_path_for, commit_output, discard_output
+from seeding import new_seed, job_rngs, spawn_seeds, seed_metadata, read_render_params
+from audio_formats import OUTPUT_FORMATS, output_format
+from profiles import PROFILES, compile_plan
 
 # ==========================
 # USER CONFIGURATION
@@ -13,7 +18,7 @@ from multiprocessing import Process
 
 # Audio Settings
 SR = 8000  # Sample rate (Hz)
-USER_NAME = "user1"
+USER_NAME = "user1"  # Default profile (see profiles.py)
 
 # Duration Settings (in seconds)
 BASE_DURATION_SECONDS = 1 * 3600 + 20 * 60  # 1 hour 20 minutes (80 min)
@@ -24,6 +29,9 @@ EXTRA_DURATION_MAX = 15 * 60  # Maximum extra duration (15 min)
 BACKGROUND_NOISES = ["fan", "white_noise", "none"]  # Types of background noise
 AUDIOS_TO_GENERATE = 4  # Number of audio files to generate per background noise type
 USE_MULTIPROCESSING = True  # Enable parallel processing
+MAX_WORKERS = None  # Worker processes for the job pool (None = CPU count)
+SEED = None  # Run seed; each job's seed is derived from it (None = fresh entropy)
+OUTPUT_FORMAT = "wav"  # Output codec: wav, flac (lossless), opus / vorbis / mp3 (low bitrate)
 
 # Voice Processing Settings
 SILENCE_CHANCE = 0.15  # Probability of adding silence instead of playing clip (0.0-1.0)
@@ -39,8 +47,13 @@ CLIP_TRIM_MAX = 0.95  # Maximum clip trim ratio
 # Audio Mixing Settings
 BG_NOISE_LEVEL = 0.01  # Background noise amplitude level
 PEAK_NORMALIZATION = 0.9  # Peak normalization level (0.0-1.0)
+LIVE_PREVIEW_GAIN = 0.5  # Fixed gain for live previews (the session peak isn't known yet)
 FINAL_PEAK_NORMALIZATION = 0.95  # Final peak normalization after mixing
 
+# Buffer Settings
+ROUND_BUFFER_SECONDS = 5 * 60  # Preallocated per-round buffer (grows if a round runs longer)
+CLIP_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Decoded voice clips kept in memory (256 MB)
+
 # ==========================
 # BASE CONFIG
 # ==========================
@@ -48,6 +61,10 @@ FINAL_PEAK_NORMALIZATION = 0.95  # Final peak normalization after mixing
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_ROOT = os.path.join(BASE_DIR, "output")
 
+# Shared by every round and job in this process
+# Served from voices/clips-8000.pcm when packed (python clip_pack.py voices --sr 8000)
+CLIPS = ClipLibrary(os.path.join(BASE_DIR, "voices"), SR, max_bytes=CLIP_CACHE_MAX_BYTES)
+
 # ==========================
 # ROUND LOGIC
 # ==========================
@@ -90,21 +107,40 @@ INTENSITY = {
 }
 
 # ==========================
-# VOICE FX
+# USER PROFILES
 # ==========================
 
-def soften_voice(audio):
-    audio *= 0.9
-    return librosa.effects.preemphasis(audio, coef=0.85)
+# Renderer settings for users without a profile; profiles.py overrides
+# them per user. The per-clip chain is soften -> fade -> gain -> mic
+# colour (preemphasis).
+PROFILE_DEFAULTS = {
+    "bg_noise": "none",
+    "noise_level": BG_NOISE_LEVEL,
+    "preemphasis": 0.93,
+    "soften": None,
+    "limit": None,
+    "gain_db": (-1.0, 1.5),
+    "silence_chance": SILENCE_CHANCE,
+    "pause_scale": 1.0,
+    "play_probability": PLAY_PROBABILITY,
+    "clips": {},
+}
 
-def mic_color(audio):
-    return librosa.effects.preemphasis(audio, coef=0.93)
+_plans = {}
+
+def render_plan(user):
+    """``user``'s compiled ``RenderPlan``, built once per process."""
+    plan = _plans.get(user)
+    if plan is None:
+        plan = _plans[user] = compile_plan(user, PROFILE_DEFAULTS, CLIPS)
+    return plan
 
 # ==========================
 # CORE FUNCTIONS
 # ==========================
 
 def get_current_phase(elapsed):
+    # elapsed: seconds of audio rendered since the round started
     if elapsed < 30:
         return "early"
     elif elapsed < 90:
@@ -114,177 +150,295 @@ def get_current_phase(elapsed):
     return "end"
 
 def play_random_clip_from(source, state):
-    folder = os.path.join(BASE_DIR, "voices", source)
-    if not os.path.exists(folder):
-        return
-
-    files = [f for f in os.listdir(folder) if f.endswith(".mp3")]
-    if not files:
+    rng = state["rng"]
+    plan = state["plan"]
+    picked = CLIPS.random_clip(source, rng, plan.clips.get(source))
+    if picked is None:
         return
 
-    file = random.choice(files)
-    audio, _ = librosa.load(os.path.join(folder, file), sr=SR)
+    clip = picked[1]
 
     intensity = INTENSITY.get(source, 0.4)
     state["energy"] = state["energy"] * 0.7 + intensity * 0.3
 
-    if random.random() < CLIP_TRIM_CHANCE:
-        audio = audio[: int(len(audio) * random.uniform(CLIP_TRIM_MIN, CLIP_TRIM_MAX))]
-
-    if USER_NAME == "g3ooorge":
-        audio = soften_voice(audio)
+    if rng.random() < CLIP_TRIM_CHANCE:
+        clip = clip[: int(len(clip) * rng.uniform(CLIP_TRIM_MIN, CLIP_TRIM_MAX))]
 
-    if random.random() < FADE_CHANCE:
-        fade = np.linspace(1.0, random.uniform(FADE_MIN, FADE_MAX), len(audio))
-        audio *= fade
+    fade_end = None
+    if rng.random() < FADE_CHANCE:
+        fade_end = rng.uniform(FADE_MIN, FADE_MAX)
 
-    gain_db = random.uniform(-1.0, 1.5) * state["energy"]
-    audio *= 10 ** (gain_db / 20)
+    gain_db = rng.uniform(*plan.gain_db) * state["energy"]
 
-    audio = mic_color(audio)
-    state["audio"] = np.concatenate([state["audio"], audio])
+    # Rendered straight into the timeline; the cached clip is never copied
+    out = state["audio"].claim(len(clip))
+    plan.fx.render(clip, out, 10 ** (gain_db / 20), fade_end)
 
 def add_silence(seconds, state):
-    silence = np.zeros(int(seconds * SR))
-    state["audio"] = np.concatenate([state["audio"], silence])
+    state["audio"].append_silence(int(seconds * SR))
+
+def load_noise_bed(bg_noise):
+    """Memory-mapped noise bed from the PCM cache, or ``None`` if missing."""
+    noise_path = os.path.join(BASE_DIR, "voices", "bg_noise", f"{bg_noise}.mp3")
+    if bg_noise == "none" or not os.path.exists(noise_path):
+        return None
+    noise, _ = pcm_cache.load(noise_path, SR, mmap=True)
+    return noise
 
 def mix_background_noise(speech, bg_noise, level=None):
+    """Mix the looped noise bed into ``speech`` in place and return it."""
     if level is None:
         level = BG_NOISE_LEVEL
-    noise_path = os.path.join(BASE_DIR, "voices", "bg_noise", f"{bg_noise}.mp3")
-    if not os.path.exists(noise_path):
+    noise = load_noise_bed(bg_noise)
+    if noise is None:
         return speech
 
-    try:
-        noise, _ = librosa.load(noise_path, sr=SR)
-
-        if len(noise) < len(speech):
-            noise = np.tile(noise, int(np.ceil(len(speech) / len(noise))))
-
-        noise = noise[: len(speech)]
-        return speech + noise * level
-    except (MemoryError, np.core._exceptions._ArrayMemoryError) as e:
-        print(f"[WARNING] Failed to load background noise '{bg_noise}': {e}")
-        print("[WARNING] Skipping background noise mixing for this file")
-        return speech
+    # Mixed one block at a time
+    return mix_looped_noise(speech, noise, level)
 
 # ==========================
 # ROUND GENERATION
 # ==========================
 
 def generate_round(state):
-    state["energy"] *= random.uniform(0.6, 0.85)
-    start = time.time()
+    rng = state["rng"]
+    plan = state["plan"]
+    state["energy"] *= rng.uniform(0.6, 0.85)
+    # Phases follow rendered audio time, not how fast this machine renders
+    round_start = len(state["audio"])
 
     for source in ROUND_SEQUENCE:
-        phase = get_current_phase(time.time() - start)
+        phase = get_current_phase((len(state["audio"]) - round_start) / SR)
 
         if source not in PHASE_RULES[phase]:
             continue
-        if random.random() > PLAY_PROBABILITY[source]:
+        if rng.random() > plan.play_probability[source]:
             continue
 
-        if random.random() < SILENCE_CHANCE:
-            add_silence(random.uniform(SILENCE_MIN, SILENCE_MAX), state)
+        if rng.random() < plan.silence_chance:
+            add_silence(rng.uniform(SILENCE_MIN, SILENCE_MAX), state)
             continue
 
         play_random_clip_from(source, state)
 
-        r = random.random()
+        r = rng.random()
         if r < 0.5:
-            pause = random.uniform(0.05, 0.3)
+            pause = rng.uniform(0.05, 0.3)
         elif r < 0.9:
-            pause = random.uniform(0.4, 1.2)
+            pause = rng.uniform(0.4, 1.2)
         else:
-            pause = random.uniform(2.5, 5.0)
+            pause = rng.uniform(2.5, 5.0)
+
+        add_silence(pause * plan.pause_scale, state)
 
-        add_silence(pause, state)
+    add_silence(rng.uniform(1.0, 3.0), state)
 
-    add_silence(random.uniform(1.0, 3.0), state)
+def iter_rounds(state, target_seconds):
+    """Render rounds until ``target_seconds`` of audio exist, yielding each one.
+
+    Each yielded array is a view of ``state["audio"]`` that is only valid
+    until the next round starts; copy or write it out before resuming.
+    """
+    rendered = 0
+    while rendered / SR < target_seconds:
+        generate_round(state)
+        audio = state["audio"].to_array()
+        rendered += len(audio)
+        yield audio
+        state["audio"].clear()
 
 # ==========================
 # AUDIO JOB
 # ==========================
 
-def generate_audio_job(bg_noise, version):
+def generate_audio_job(bg_noise=None, version=1, seed=None, out_path=None, progress=None, live_path=None,
+                       codec=None, user=None, duration=None):
+    """Render one session and return the path written.
+
+    The same ``seed`` always gives the same file. Without ``out_path`` the
+    file gets the next number in ``output/<bg_noise>/``. ``progress`` is
+    called with the rendered fraction (0.0-1.0) after every round. With
+    ``live_path``, every finished round is also appended to a playable
+    preview there (see ``LivePreview``). ``codec`` overrides
+    ``OUTPUT_FORMAT`` and must match the extension of ``out_path``.
+    ``user`` picks the profile (default ``USER_NAME``); without
+    ``bg_noise`` the profile's noise bed is used. ``duration`` (seconds)
+    replaces the random 80 min + extra target length.
+    """
+    plan = render_plan(user or USER_NAME)
+    if bg_noise is None:
+        bg_noise = plan.bg_noise
+    format, subtype, ext = output_format(codec or OUTPUT_FORMAT, SR)
+    if seed is None:
+        seed = new_seed()
+    rng, _ = job_rngs(seed)
+
+    EXTRA_SECONDS = rng.randint(EXTRA_DURATION_MIN, EXTRA_DURATION_MAX)
+    TARGET_SECONDS = BASE_DURATION_SECONDS + EXTRA_SECONDS
+    if duration is not None:
+        # Still drawn above, so a shorter render matches the start of the full one
+        TARGET_SECONDS = duration
+
     state = {
-        "audio": np.array([], dtype=np.float32),
+        # Holds one round at a time; finished rounds are spooled to disk
+        "audio": Timeline(ROUND_BUFFER_SECONDS * SR),
         "energy": 0.3,
+        "rng": rng,
+        "plan": plan,
     }
 
-    EXTRA_SECONDS = random.randint(EXTRA_DURATION_MIN, EXTRA_DURATION_MAX)
-    TARGET_SECONDS = BASE_DURATION_SECONDS + EXTRA_SECONDS
-
-    print(f"[JOB START] {bg_noise} v{version}")
-
-    while len(state["audio"]) / SR < TARGET_SECONDS:
-        generate_round(state)
-
-    audio = state["audio"]
+    print(f"[JOB START] {plan.user} {bg_noise} v{version} seed={seed}")
 
-    peak = np.max(np.abs(audio))
-    if peak > 0:
-        audio = audio / peak * PEAK_NORMALIZATION
-
-    if bg_noise != "none":
-        audio = mix_background_noise(audio, bg_noise)
-
-    peak = np.max(np.abs(audio))
-    if peak > 0:
-        audio = audio / peak * FINAL_PEAK_NORMALIZATION
-
-    out_dir = os.path.join(OUTPUT_ROOT, bg_noise)
+    if out_path is None:
+        out_dir = os.path.join(OUTPUT_ROOT, bg_noise)
+    else:
+        out_dir = os.path.dirname(os.path.abspath(out_path))
     os.makedirs(out_dir, exist_ok=True)
 
-    # ------------
-    file_name = 0
-    files = os.listdir(out_dir)
-
-    # Extract numbers from filenames and find the highest
-    numbers = []
-    for file in files:
-        # Assuming filenames contain numbers like fan_1.wav
-        match = re.search(r'\d+', file)
-        if match:
-            numbers.append(int(match.group()))
-
-    if numbers:
-        highest_number = max(numbers)
-        file_name = highest_number + 1
-
-    out_path = os.path.join(out_dir, f"{file_name}.wav")
-    sf.write(out_path, audio, SR)
+    live = None
+    if live_path is not None:
+        live = LivePreview(live_path, SR, LIVE_PREVIEW_GAIN, load_noise_bed(bg_noise), plan.noise_level)
+
+    with SessionWriter(SR, out_dir) as session:
+        try:
+            for audio in iter_rounds(state, TARGET_SECONDS):
+                session.write(audio)
+                if live is not None:
+                    live.write(audio)
+                if progress is not None:
+                    progress(min(session.seconds / TARGET_SECONDS, 1.0))
+        finally:
+            if live is not None:
+                live.close()
+
+        # Second pass, in place over the memory-mapped session
+        audio = session.audio()
+        normalize_peak(audio, session.peak, PEAK_NORMALIZATION)
+
+        if bg_noise != "none":
+            mix_background_noise(audio, bg_noise, plan.noise_level)
+
+        normalize_peak(audio, peak_abs(audio), FINAL_PEAK_NORMALIZATION)
+
+        if out_path is None:
+            out_path, part_path = reserve_output(out_dir, ext=ext)
+        else:
+            part_path = part_path_for(out_path)
+        try:
+            # The ".part" name hides the extension, so the codec is always explicit
+            metadata = seed_metadata(seed, user=plan.user, bg_noise=bg_noise, duration=duration)
+            session.save(part_path, format=format, subtype=subtype, metadata=metadata)
+            commit_output(part_path, out_path)
+        except BaseException:
+            discard_output(part_path)
+            raise
 
     print(f"[JOB DONE] {out_path}")
+    return out_path
 
 # ==========================
 # PARALLEL RUNNER
 # ==========================
 
-def run_bg_noise_job(bg_noise, audios_to_add):
-    for v in range(1, audios_to_add + 1):
-        generate_audio_job(bg_noise, v)
+def init_worker(clips):
+    """Pool initializer: adopt the parent's decoded clips."""
+    global CLIPS
+    CLIPS = clips
+
+def run_job(user, bg_noise, version, seed=None, codec=None):
+    start = time.time()
+    out_path = generate_audio_job(bg_noise, version, seed, codec=codec, user=user)
+    return out_path, time.time() - start
+
+def run_jobs(jobs, max_workers=None, seed=None, codec=None):
+    """Render every ``(user, bg_noise, version)`` job on a process pool.
+
+    Each job gets its own seed spawned from ``seed``, so a whole run can be
+    repeated by passing the same run seed.
+    """
+    # Decode the library once here instead of once per worker
+    CLIPS.preload(set(ROUND_SEQUENCE))
+
+    total = len(jobs)
+    done = 0
+    with ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count(),
+        initializer=init_worker,
+        initargs=(CLIPS,),
+    ) as pool:
+        seeds = spawn_seeds(seed, total)
+        futures = {
+            pool.submit(run_job, user, bg, v, job_seed, codec): (user, bg, v)
+            for (user, bg, v), job_seed in zip(jobs, seeds)
+        }
+        for future in as_completed(futures):
+            user, bg, v = futures[future]
+            done += 1
+            try:
+                out_path, seconds = future.result()
+                print(f"[{done}/{total}] {user} {bg} v{v} done in {seconds:.1f}s -> {out_path}")
+            except Exception as e:
+                print(f"[{done}/{total}] {user} {bg} v{v} FAILED: {e!r}")
+
+def run_bg_noise_job(bg_noise, audios_to_add, seeds, user=None, codec=None):
+    for v, job_seed in zip(range(1, audios_to_add + 1), seeds):
+        run_start = time.time()
+        generate_audio_job(bg_noise, v, job_seed, codec=codec, user=user)
+        print(f"[{bg_noise} v{v}] {time.time() - run_start:.1f}s")
 
 # ==========================
 # MAIN
 # ==========================
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render voice chat sessions into output/<bg_noise>/.")
+    parser.add_argument("--user", default=USER_NAME, help="profile to render with (see profiles.py)")
+    parser.add_argument(
+        "--bg-noise", action="append", choices=BACKGROUND_NOISES,
+        help="noise bed, repeatable (default: the profile's, or all of them for users without one)",
+    )
+    parser.add_argument("--count", type=int, default=AUDIOS_TO_GENERATE, help="sessions per noise bed")
+    parser.add_argument("--seed", type=int, default=SEED, help="run seed, to repeat a run exactly")
+    parser.add_argument("--format", default=OUTPUT_FORMAT, choices=sorted(OUTPUT_FORMATS), help="output codec")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="worker processes (default: CPU count)")
+    parser.add_argument("--sequential", action="store_true", default=not USE_MULTIPROCESSING,
+                        help="render in this process, one job at a time")
+    parser.add_argument("--out", help="render a single session to this path instead")
+    parser.add_argument("--regenerate", metavar="FILE",
+                        help="re-render a session from the seed, user, noise bed and length recorded in FILE")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    processes = []
-
-    if USE_MULTIPROCESSING:
-        for bg in BACKGROUND_NOISES:
-            p = Process(
-                target=run_bg_noise_job,
-                args=(bg, AUDIOS_TO_GENERATE)
-            )
-            p.start()
-            processes.append(p)
-
-        for p in processes:
-            p.join()
+    args = parse_args()
+    if args.bg_noise:
+        bg_noises = args.bg_noise
+    elif args.user in PROFILES:
+        bg_noises = [render_plan(args.user).bg_noise]
+    else:
+        bg_noises = BACKGROUND_NOISES
+
+    start = time.time()
+    if args.regenerate:
+        recorded = read_render_params(args.regenerate)
+        if "seed" not in recorded:
+            raise SystemExit(f"{args.regenerate} has no recorded seed")
+        generate_audio_job(
+            recorded.get("bg_noise"),
+            seed=recorded["seed"],
+            out_path=args.out,
+            codec=args.format,
+            user=recorded.get("user", args.user),
+            duration=recorded.get("duration"),
+        )
+    elif args.out:
+        generate_audio_job(bg_noises[0], seed=args.seed, out_path=args.out, codec=args.format, user=args.user)
+    elif not args.sequential:
+        jobs = [(args.user, bg, v) for bg in bg_noises for v in range(1, args.count + 1)]
+        run_jobs(jobs, args.workers, args.seed, args.format)
     else:
-        for bg in BACKGROUND_NOISES:
-            run_bg_noise_job(bg, AUDIOS_TO_GENERATE)
+        seeds = spawn_seeds(args.seed, len(bg_noises) * args.count)
+        for i, bg in enumerate(bg_noises):
+            bg_seeds = seeds[i * args.count : (i + 1) * args.count]
+            run_bg_noise_job(bg, args.count, bg_seeds, args.user, args.format)
 
-    print("\nAll audio generation jobs completed.")
+    print(f"\nAll audio generation jobs completed in {time.time() - start:.1f}s.")
@@ -0,0 +1,86 @@
+import os
+import re
+import tempfile
+
+# ==========================
+# OUTPUT FILE NUMBERING
+# ==========================
+
+HINT_FILE = ".next_index"  # Next free number per output folder
+
+def _read_hint(out_dir):
+    try:
+        with open(os.path.join(out_dir, HINT_FILE)) as fh:
+            return int(fh.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def _write_hint(out_dir, number):
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=HINT_FILE, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        fh.write(str(number))
+    os.chmod(tmp_path, 0o644)  # mkstemp files are private to this user
+    try:
+        os.replace(tmp_path, os.path.join(out_dir, HINT_FILE))
+    except OSError:
+        os.remove(tmp_path)  # Another job just updated it
+
+def _scan(out_dir, prefix, start):
+    # Legacy numbering (max + 1), only needed once per folder to seed the hint
+    pattern = re.compile(re.escape(prefix) + r"(\d+)")
+    numbers = []
+    for file in os.listdir(out_dir):
+        if file.startswith("."):
+            continue
+        match = pattern.search(file)
+        if match:
+            numbers.append(int(match.group(1)))
+    return max(numbers) + 1 if numbers else start
+
+def part_path_for(final_path):
+    """Hidden temp name a file is written to before ``commit_output``."""
+    folder, name = os.path.split(final_path)
+    return os.path.join(folder, f".{name}.part")
+
+def reserve_output(out_dir, ext=".wav", prefix="", start=0):
+    """Claim the next free ``<prefix><n><ext>`` in ``out_dir``.
+
+    Returns ``(final_path, part_path)``. The number is claimed by creating
+    the hidden ``part_path`` with ``O_EXCL``, so concurrent jobs (processes
+    or web requests) can never get the same one. Write the file to
+    ``part_path`` and publish it with ``commit_output``; readers never see
+    a half-written file. The ``.next_index`` hint keeps this O(1) instead
+    of listing the folder.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    number = _read_hint(out_dir)
+    if number is None:
+        number = _scan(out_dir, prefix, start)
+
+    while True:
+        final_path = os.path.join(out_dir, f"{prefix}{number}{ext}")
+        part_path = part_path_for(final_path)
+        try:
+            # 0o666 under the umask, like the files sf.write used to create
+            os.close(os.open(part_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+        except FileExistsError:
+            number += 1
+            continue
+        if os.path.exists(final_path):
+            # Published by a job that started from an older hint
+            os.remove(part_path)
+            number += 1
+            continue
+        _write_hint(out_dir, number + 1)
+        return final_path, part_path
+
+def commit_output(part_path, final_path):
+    """Atomically publish a finished output file."""
+    os.replace(part_path, final_path)
+
+def discard_output(part_path):
+    """Release a reservation whose render failed."""
+    try:
+        os.remove(part_path)
+    except OSError:
+        pass
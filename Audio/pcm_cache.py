@@ -0,0 +1,78 @@
+import os
+import hashlib
+import tempfile
+import numpy as np
+import librosa
+
+# ==========================
+# DECODED PCM DISK CACHE
+# ==========================
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, ".pcm_cache")
+
+def _digest(*parts):
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+def cache_path(path, sr, mono=True, cache_dir=None):
+    """Cache file for a source, or ``None`` if the source does not exist.
+
+    The name is ``<source>-<sr>-<channels>-<version>.npy``: the version part
+    hashes the source's mtime and size, so editing or replacing a file makes
+    the old entry unreachable.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    prefix = f"{_digest(os.path.abspath(path))[:16]}-{sr}-{'mono' if mono else 'multi'}-"
+    version = _digest(st.st_mtime_ns, st.st_size)[:12]
+    return os.path.join(cache_dir or CACHE_DIR, f"{prefix}{version}.npy")
+
+def _drop_stale(entry):
+    folder = os.path.dirname(entry)
+    prefix = os.path.basename(entry).rsplit("-", 1)[0] + "-"
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and os.path.join(folder, name) != entry:
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
+
+def _store(entry, audio):
+    folder = os.path.dirname(entry)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            np.save(fh, audio)
+        os.chmod(tmp_path, 0o644)  # mkstemp files are private to this user
+        os.replace(tmp_path, entry)
+    except OSError:
+        # Another process may hold the entry open (e.g. mapped on Windows);
+        # its copy is just as good.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    _drop_stale(entry)
+
+def load(path, sr, mono=True, mmap=False, cache_dir=None):
+    """Drop-in for ``librosa.load(path, sr=sr, mono=mono)`` backed by the cache.
+
+    Returns ``(audio, sr)`` as float32. With ``mmap=True`` the array is a
+    read-only memory map of the cache file, so it costs no RAM up front.
+    """
+    entry = cache_path(path, sr, mono, cache_dir)
+    if entry is not None and os.path.exists(entry):
+        try:
+            return np.load(entry, mmap_mode="r" if mmap else None), sr
+        except (OSError, ValueError):
+            pass  # Truncated or foreign file: decode again and overwrite
+
+    audio, _ = librosa.load(path, sr=sr, mono=mono)
+    audio = np.asarray(audio, dtype=np.float32)
+    if entry is not None:
+        _store(entry, audio)
+    if mmap:
+        audio.flags.writeable = False
+    return audio, sr
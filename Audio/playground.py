@@ -1,10 +1,10 @@
-import time
-import random
 import os
 import numpy as np
-import librosa
-import soundfile as sf
-import re
+from clip_library import ClipLibrary
+from output_naming import reserve_output, commit_output, discard_output
+from session_writer import write_audio
+from seeding import new_seed, job_rngs, seed_metadata
+from audio_formats import output_format
 
 # ==========================
 # BASE CONFIG
@@ -15,6 +15,10 @@ VOICES_AI_DIR = os.path.join(BASE_DIR, "voices_ai")
 OUTPUT_ROOT = os.path.join(BASE_DIR, "output")
 
 SR = 16000
+OUTPUT_FORMAT = "wav"  # Output codec: wav, flac (lossless), opus / vorbis / mp3 (low bitrate)
+
+# Served from voices_ai/clips-16000.pcm when packed (python clip_pack.py voices_ai --sr 16000 --ext .mp3 --ext .wav --ext .ogg --ext .flac)
+CLIPS = ClipLibrary(VOICES_AI_DIR, SR, extensions=(".mp3", ".wav", ".ogg", ".flac"))
 
 # ==========================
 # ROUND LOGIC FOR VOICES_AI
@@ -31,26 +35,15 @@ MAIN_LOOP_SEQUENCE = ["round_start", "strategy", "random", "enemy_info"]
 # ==========================
 
 def load_audio_files_from_folder(folder_name):
-    """Load all audio files from a specific folder in voices_ai."""
-    folder_path = os.path.join(VOICES_AI_DIR, folder_name)
-    
-    if not os.path.exists(folder_path):
-        return []
-    
-    audio_files = []
-    for f in os.listdir(folder_path):
-        if f.endswith((".mp3", ".wav", ".ogg", ".flac")):
-            audio_files.append(os.path.join(folder_path, f))
-    
-    return audio_files
+    """List the audio files in a voices_ai folder (scanned once per run)."""
+    return CLIPS.files(folder_name)
 
-def load_audio(file_path):
-    """Load audio from file."""
+def load_audio(folder_name, file_name):
+    """Load decoded audio through the clip library (decoded once per run)."""
     try:
-        audio, _ = librosa.load(file_path, sr=SR)
-        return audio
+        return CLIPS.load(folder_name, file_name)
     except Exception as e:
-        print(f"Error loading {file_path}: {e}")
+        print(f"Error loading {file_name}: {e}")
         return None
 
 def get_audio_duration(audio):
@@ -73,8 +66,8 @@ def play_random_clip_from(folder_name, state):
         print(f"No audio files found in {folder_name}")
         return 0
     
-    selected_file = random.choice(audio_files)
-    audio = load_audio(selected_file)
+    selected_file = state["rng"].choice(audio_files)
+    audio = load_audio(folder_name, selected_file)
     
     if audio is not None:
         state["audio"] = np.concatenate([state["audio"], audio])
@@ -86,7 +79,7 @@ def play_random_clip_from(folder_name, state):
 
 def add_random_pause(state):
     """Add a random pause between 5-10 seconds."""
-    pause = random.uniform(5, 10)
+    pause = state["rng"].uniform(5, 10)
     add_silence(pause, state)
     return pause
 
@@ -97,7 +90,6 @@ def add_random_pause(state):
 def generate_round(round_number, state):
     """Generate a single round (2:30 = 150 seconds)."""
     state["audio"] = np.array([], dtype=np.float32)
-    round_start_time = time.time()
     elapsed_time = 0
     
     print(f"\n=== ROUND {round_number} ===")
@@ -107,7 +99,7 @@ def generate_round(round_number, state):
     if round_number == 1:
         include_greeting = True
     else:
-        include_greeting = random.random() < 0.5  # 50% chance
+        include_greeting = state["rng"].random() < 0.5  # 50% chance
     
     if include_greeting:
         elapsed_time += play_random_clip_from("greetings", state)
@@ -154,13 +146,18 @@ def generate_round(round_number, state):
 # AUDIO JOB
 # ==========================
 
-def generate_audio_job(num_rounds=5, output_name="voices_ai_output"):
-    """Generate audio with multiple rounds."""
+def generate_audio_job(num_rounds=5, output_name="voices_ai_output", seed=None):
+    """Generate audio with multiple rounds (reproducible from ``seed``)."""
+    if seed is None:
+        seed = new_seed()
+    rng, _ = job_rngs(seed)
+
     state = {
         "audio": np.array([], dtype=np.float32),
+        "rng": rng,
     }
     
-    print(f"[JOB START] Generating {num_rounds} rounds")
+    print(f"[JOB START] Generating {num_rounds} rounds (seed={seed})")
     
     for round_num in range(1, num_rounds + 1):
         round_audio = generate_round(round_num, state)
@@ -180,21 +177,15 @@ def generate_audio_job(num_rounds=5, output_name="voices_ai_output"):
     out_dir = OUTPUT_ROOT
     os.makedirs(out_dir, exist_ok=True)
     
-    # Find next file number
-    file_number = 1
-    if os.path.exists(out_dir):
-        files = os.listdir(out_dir)
-        numbers = []
-        for file in files:
-            match = re.search(r'\d+', file)
-            if match:
-                numbers.append(int(match.group()))
-        
-        if numbers:
-            file_number = max(numbers) + 1
-    
-    out_path = os.path.join(out_dir, f"{output_name}_{file_number}.wav")
-    sf.write(out_path, audio, SR)
+    # Claim the next file number (safe with concurrent runs)
+    format, subtype, ext = output_format(OUTPUT_FORMAT, SR)
+    out_path, part_path = reserve_output(out_dir, ext=ext, prefix=f"{output_name}_", start=1)
+    try:
+        write_audio(part_path, audio, SR, format=format, subtype=subtype, metadata=seed_metadata(seed, num_rounds=num_rounds))
+        commit_output(part_path, out_path)
+    except BaseException:
+        discard_output(part_path)
+        raise
     
     total_duration = len(audio) / SR
     print(f"\n[JOB DONE] Saved to {out_path}")
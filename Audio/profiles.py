@@ -0,0 +1,75 @@
+from dsp import ClipFX
+
+# ==========================
+# USER PROFILES
+# ==========================
+
+# Per-user overrides of the renderer defaults (see main.py's config).
+# Keys a profile may set:
+#   bg_noise          noise bed used when a job doesn't name one
+#   noise_level       noise bed amplitude
+#   preemphasis       mic-colour preemphasis coefficient
+#   soften            (gain, preemphasis coef) applied before everything else, or None
+#   limit             hard clip level, or None
+#   gain_db           (min, max) per-clip loudness variation, scaled by energy
+#   silence_chance    probability a turn is skipped with a short silence
+#   pause_scale       multiplies every pause between clips (pacing)
+#   play_probability  per-category chance a turn plays, merged over the defaults
+#   clips             category -> file names this user may use (clip subset)
+PROFILES = {
+    "botfrag666": {"bg_noise": "none"},
+    "elooo2092": {"bg_noise": "white_noise"},
+    "echogreg": {"bg_noise": "fan"},
+    "kooooalaid": {"bg_noise": "none"},
+    "g3ooorge": {"bg_noise": "white_noise", "soften": (0.9, 0.85)},
+}
+
+def profile_settings(user, defaults):
+    """``defaults`` with ``user``'s overrides applied; unknown users get the defaults."""
+    overrides = PROFILES.get(user, {})
+    unknown = set(overrides) - set(defaults)
+    if unknown:
+        raise ValueError(f"Profile {user!r} sets unknown keys: {sorted(unknown)}")
+    settings = dict(defaults)
+    settings.update(overrides)
+    settings["play_probability"] = {**defaults["play_probability"], **overrides.get("play_probability", {})}
+    return settings
+
+def noise_mapping():
+    """``{user: bg_noise}`` for every profile (the web app's user list)."""
+    return {user: profile.get("bg_noise", "none") for user, profile in PROFILES.items()}
+
+class RenderPlan:
+    """One user's settings resolved once into what the render loop reads.
+
+    Built by ``compile_plan``: the FX chain is constructed, clip subsets
+    are checked against the library and frozen, and every knob is a plain
+    attribute, so rendering a clip involves no lookups by user name.
+    """
+
+    def __init__(self, user, settings, clips):
+        self.user = user
+        self.bg_noise = settings["bg_noise"]
+        self.noise_level = settings["noise_level"]
+        self.fx = ClipFX(
+            preemphasis=settings["preemphasis"],
+            soften=settings["soften"],
+            limit=settings["limit"],
+        )
+        self.gain_db = settings["gain_db"]
+        self.silence_chance = settings["silence_chance"]
+        self.pause_scale = settings["pause_scale"]
+        self.play_probability = settings["play_probability"]
+        self.clips = clips  # category -> tuple of names, or None for the whole folder
+
+def compile_plan(user, defaults, library):
+    """Resolve ``user``'s profile against ``defaults`` and a ``ClipLibrary``."""
+    settings = profile_settings(user, defaults)
+    clips = {}
+    for category, names in settings["clips"].items():
+        available = set(library.files(category))
+        missing = [name for name in names if name not in available]
+        if missing:
+            raise ValueError(f"Profile {user!r}: no {category} clips named {missing}")
+        clips[category] = tuple(sorted(names))
+    return RenderPlan(user, settings, clips)
@@ -0,0 +1,62 @@
+import random
+import secrets
+import numpy as np
+import soundfile as sf
+
+# ==========================
+# PER-JOB RANDOM STREAMS
+# ==========================
+
+def new_seed():
+    """Fresh 63-bit job seed from OS entropy."""
+    return secrets.randbits(63)
+
+def job_rngs(seed):
+    """The ``(random.Random, numpy Generator)`` pair a job draws from."""
+    return random.Random(seed), np.random.default_rng(seed)
+
+def spawn_seeds(base_seed, count):
+    """``count`` independent job seeds derived from one run seed.
+
+    Uses ``SeedSequence.spawn``, so the streams are statistically
+    independent and the same ``base_seed`` always gives the same list.
+    """
+    children = np.random.SeedSequence(base_seed).spawn(count)
+    return [int(child.generate_state(1, dtype=np.uint64)[0] >> np.uint64(1)) for child in children]
+
+def seed_metadata(seed, **params):
+    """Sound-file metadata recording what a file was rendered from.
+
+    The seed alone doesn't reproduce a session: the profile, noise bed
+    and length are render inputs too, so any given ``params`` (``None``
+    values are skipped) are recorded next to it as
+    ``seed=<n>;user=<name>;bg_noise=<bed>;duration=<seconds>``.
+    """
+    fields = {"seed": seed, **{key: value for key, value in params.items() if value is not None}}
+    return {"comment": ";".join(f"{key}={value}" for key, value in fields.items())}
+
+def read_render_params(path):
+    """``{"seed", "user", "bg_noise", "duration"}`` recorded in a rendered file.
+
+    Only the keys that were recorded are present; files from before the
+    other inputs were recorded carry just the seed.
+    """
+    with sf.SoundFile(path) as fh:
+        comment = fh.comment or ""
+    params = {}
+    for part in comment.replace(";", " ").split():
+        key, sep, value = part.partition("=")
+        if not sep:
+            continue
+        if key == "seed":
+            params[key] = int(value)
+        elif key == "duration":
+            # An int stays an int, so a re-render writes the same comment back
+            params[key] = int(value) if value.isdigit() else float(value)
+        else:
+            params[key] = value
+    return params
+
+def read_seed(path):
+    """Seed recorded in a rendered file, or ``None``."""
+    return read_render_params(path).get("seed")
@@ -1,8 +1,11 @@
 import os
-import random
 import numpy as np
-import librosa
-import soundfile as sf
+import pcm_cache
+import vad
+from clip_pack import derived_pack
+from session_writer import write_audio
+from seeding import new_seed, job_rngs, seed_metadata
+from audio_formats import output_format
 
 # ==========================
 # CONFIG
@@ -14,8 +17,14 @@ OUTPUT_DIR = os.path.join(BASE_DIR, "output")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 SR = 22050
+OUTPUT_FORMAT = "wav"  # Output codec: wav, flac (lossless), vorbis / mp3 (low bitrate; Opus can't do 22.05 kHz)
 
-TARGET_MINUTES = random.uniform(5, 10)
+# Seed for this session (None = fresh); recorded in the output file
+SEED = None
+seed = SEED if SEED is not None else new_seed()
+rng, np_rng = job_rngs(seed)
+
+TARGET_MINUTES = rng.uniform(5, 10)
 TARGET_SECONDS = TARGET_MINUTES * 60
 
 # Loudness target (shared vibe)
@@ -30,29 +39,17 @@ NORMAL_PAUSE = (0.6, 1.8)
 LONG_PAUSE = (2.0, 5.0)
 
 FADE_MS = 15  # micro fade for clip edges
-
-# ==========================
-# LOAD CLIPS
-# ==========================
-files = [
-    f for f in os.listdir(INPUT_DIR)
-    if f.lower().endswith((".wav", ".mp3"))
-]
-
-if not files:
-    raise RuntimeError("No clips found in output_clips")
-
-print(f"Loaded {len(files)} clips")
-print(f"Target duration: {TARGET_MINUTES:.2f} minutes")
+TRIM_TOP_DB = 40  # Silence trimmed from loose clips' edges (packed clips already end at splitter.py's TOP_DB)
 
 # ==========================
 # AUDIO HELPERS
 # ==========================
-def rms_normalize(audio, target_rms):
-    rms = np.sqrt(np.mean(audio**2))
+def rms_normalize(audio, target_rms, rms=None):
+    if rms is None:
+        rms = np.sqrt(np.mean(audio**2))
     if rms > 0:
-        audio = audio * (target_rms / rms)
-    return audio
+        return audio * (target_rms / rms)
+    return audio.copy()  # apply_fade writes in place; packed clips are read-only
 
 def apply_fade(audio, fade_ms):
     fade_len = int(SR * fade_ms / 1000)
@@ -66,57 +63,96 @@ def apply_fade(audio, fade_ms):
     audio[-fade_len:] *= fade_out
     return audio
 
-def load_clip(filename):
-    audio, _ = librosa.load(
-        os.path.join(INPUT_DIR, filename),
-        sr=SR,
-        mono=True
-    )
-
-    audio = rms_normalize(audio, TARGET_RMS)
-    audio = apply_fade(audio, FADE_MS)
+def prepare_clip(audio, clip=None):
+    """Loudness-match and fade one clip, ready to be copied into a session.
 
-    return audio
+    ``clip`` is the clip's pack index entry; its RMS was measured at ingest.
+    """
+    audio = rms_normalize(audio, TARGET_RMS, clip["rms"] if clip is not None else None)
+    return apply_fade(audio, FADE_MS)
 
 def noise(seconds):
-    return np.random.normal(
+    return np_rng.normal(
         0, NOISE_LEVEL, int(seconds * SR)
     ).astype(np.float32)
 
+# ==========================
+# LOAD CLIPS
+# ==========================
+# Everything prepare_clip depends on; changing any of it re-prepares the pack
+PREPARE_PARAMS = {"target_rms": TARGET_RMS, "fade_ms": FADE_MS}
+
+# splitter.py's clip pack, prepared once and cached next to it, when there
+# is one; else loose clip files, prepared on first use.
+# Sorted so a seed picks the same clips on every machine
+PACK = derived_pack(INPUT_DIR, SR, "prepared", PREPARE_PARAMS, prepare_clip)
+if PACK is not None:
+    pack_keys = {name: (category, name) for category, name in PACK.entries}
+    files = sorted(pack_keys)
+else:
+    files = sorted(
+        f for f in os.listdir(INPUT_DIR)
+        if f.lower().endswith((".wav", ".mp3"))
+    )
+
+if not files:
+    raise RuntimeError("No clips found in output_clips")
+
+print(f"Loaded {len(files)} clips")
+print(f"Target duration: {TARGET_MINUTES:.2f} minutes (seed={seed})")
+
+prepared = {}  # Loose clips already prepared this run
+
+def load_clip(filename):
+    if PACK is not None:
+        return PACK.load(*pack_keys[filename])  # Zero-copy slice of the prepared pack
+    if filename not in prepared:
+        audio, _ = pcm_cache.load(
+            os.path.join(INPUT_DIR, filename),
+            SR,
+            mono=True
+        )
+        # Leftover silence at the edges would stretch the pauses
+        prepared[filename] = prepare_clip(vad.trim(audio, TRIM_TOP_DB))
+    return prepared[filename]
+
 # ==========================
 # GENERATION
 # ==========================
-output_audio = np.array([], dtype=np.float32)
+# Clips and pauses are only collected here and joined once at the end
+segments = []
 last_clip = None
 total_seconds = 0.0
 
 while total_seconds < TARGET_SECONDS:
-    clip_name = random.choice(files)
+    clip_name = rng.choice(files)
     if clip_name == last_clip and len(files) > 1:
-        clip_name = random.choice(files)
+        clip_name = rng.choice(files)
 
     clip = load_clip(clip_name)
-    output_audio = np.concatenate([output_audio, clip])
+    segments.append(clip)
     total_seconds += len(clip) / SR
     last_clip = clip_name
 
     # pause selection
-    r = random.random()
+    r = rng.random()
     if r < 0.6:
-        pause = random.uniform(*SHORT_PAUSE)
+        pause = rng.uniform(*SHORT_PAUSE)
     elif r < 0.9:
-        pause = random.uniform(*NORMAL_PAUSE)
+        pause = rng.uniform(*NORMAL_PAUSE)
     else:
-        pause = random.uniform(*LONG_PAUSE)
+        pause = rng.uniform(*LONG_PAUSE)
 
-    output_audio = np.concatenate([output_audio, noise(pause)])
+    segments.append(noise(pause))
     total_seconds += pause
 
+output_audio = np.concatenate(segments) if segments else np.array([], dtype=np.float32)
+
 # ==========================
 # FINALIZE
 # ==========================
 # Add continuous noise bed (same vibe everywhere)
-bed = np.random.normal(
+bed = np_rng.normal(
     0, NOISE_LEVEL, len(output_audio)
 ).astype(np.float32)
 
@@ -127,12 +163,13 @@ peak = np.max(np.abs(final_audio))
 if peak > 0:
     final_audio = final_audio / peak * 0.95
 
+format, subtype, ext = output_format(OUTPUT_FORMAT, SR)
 output_file = os.path.join(
     OUTPUT_DIR,
-    f"session_{int(TARGET_SECONDS)}s.wav"
+    f"session_{int(TARGET_SECONDS)}s{ext}"
 )
 
-sf.write(output_file, final_audio, SR)
+write_audio(output_file, final_audio, SR, format=format, subtype=subtype, metadata=seed_metadata(seed))
 
 print("✅ Generated:", output_file)
 print(f"Final duration: {total_seconds/60:.2f} minutes")
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import numpy as np
+import soundfile as sf
+from dsp import MIX_BLOCK, mix_looped_noise
+
+# ==========================
+# STREAMING SESSION WRITER
+# ==========================
+
+def set_metadata(sound_file, metadata):
+    """Apply text metadata (``title``, ``comment``, ...) to an open SoundFile."""
+    for key, value in (metadata or {}).items():
+        setattr(sound_file, key, value)
+
+def write_audio(path, audio, sr, format=None, subtype=None, metadata=None):
+    """``sf.write`` with text metadata."""
+    with sf.SoundFile(path, "w", sr, 1, format=format, subtype=subtype) as out:
+        set_metadata(out, metadata)
+        out.write(audio)
+
+class SessionWriter:
+    """Spools a session to disk round by round instead of holding it in RAM.
+
+    Rounds are appended to a raw float32 scratch file as they finish, and
+    the peak is tracked as they arrive. ``audio()`` maps the scratch file
+    so normalization and mixing can run in place block by block, and
+    ``save()`` streams the result into the final sound file. Memory use
+    stays at about one round plus one block, however long the session is.
+    """
+
+    def __init__(self, sr, scratch_dir, scratch_path=None):
+        self.sr = sr
+        self.samples = 0
+        self.peak = 0.0
+        if scratch_path is None:
+            os.makedirs(scratch_dir, exist_ok=True)
+            fd, scratch_path = tempfile.mkstemp(dir=scratch_dir, prefix=".session-", suffix=".f32")
+            os.close(fd)
+        self.scratch_path = scratch_path
+        self._fh = open(scratch_path, "wb")
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def seconds(self):
+        return self.samples / self.sr
+
+    def write(self, audio):
+        audio = np.asarray(audio, dtype=np.float32)
+        if not len(audio):
+            return
+        self.peak = max(self.peak, float(np.max(audio)), -float(np.min(audio)))
+        audio.tofile(self._fh)
+        self._fh.flush()
+        self.samples += len(audio)
+
+    def audio(self):
+        """The whole session as a writable memory map of the scratch file."""
+        if self._map is None:
+            self._fh.close()
+            if not self.samples:
+                return np.zeros(0, dtype=np.float32)
+            self._map = np.memmap(self.scratch_path, dtype=np.float32, mode="r+", shape=(self.samples,))
+        return self._map
+
+    def save(self, out_path, format=None, subtype=None, metadata=None, block=MIX_BLOCK):
+        """Stream the (processed) session into ``out_path``."""
+        audio = self.audio()
+        with sf.SoundFile(out_path, "w", self.sr, 1, format=format, subtype=subtype) as out:
+            set_metadata(out, metadata)
+            for pos in range(0, len(audio), block):
+                out.write(audio[pos : pos + block])
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+        self._map = None
+        try:
+            os.remove(self.scratch_path)
+        except OSError:
+            pass
+
+# ==========================
+# LIVE PREVIEW
+# ==========================
+
+def open_ended_wav_header(sr, channels=1, bits=16):
+    """WAV header for a stream of unknown length (sizes set to the maximum)."""
+    block_align = channels * bits // 8
+    return b"".join([
+        b"RIFF", (0xFFFFFFFF).to_bytes(4, "little"), b"WAVE",
+        b"fmt ", (16).to_bytes(4, "little"), (1).to_bytes(2, "little"),
+        channels.to_bytes(2, "little"), int(sr).to_bytes(4, "little"),
+        (int(sr) * block_align).to_bytes(4, "little"), block_align.to_bytes(2, "little"),
+        bits.to_bytes(2, "little"),
+        b"data", (0xFFFFFFFF).to_bytes(4, "little"),
+    ])
+
+class LivePreview:
+    """Append-only, playable copy of a session written while it renders.
+
+    The file is an open-ended 16-bit WAV that grows by one round at a time,
+    so a web server can stream it to a listener before the render finishes.
+    The final peak isn't known yet, so rounds get a fixed ``gain`` (plus the
+    noise bed, if any) and are hard-clipped instead of normalized.
+    """
+
+    def __init__(self, path, sr, gain, noise=None, noise_level=0.0):
+        self.path = path
+        self.gain = gain
+        self.noise = noise
+        self.noise_level = noise_level
+        self.samples = 0
+        self._fh = open(path, "wb")
+        self._fh.write(open_ended_wav_header(sr))
+        self._fh.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, audio):
+        block = np.multiply(audio, self.gain, dtype=np.float32)
+        if self.noise is not None:
+            mix_looped_noise(block, self.noise, self.noise_level, offset=self.samples)
+        np.clip(block, -1.0, 1.0, out=block)
+        (block * 32767).astype("<i2").tofile(self._fh)
+        self._fh.flush()
+        self.samples += len(block)
+
+    def close(self):
+        self._fh.close()
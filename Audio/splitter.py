@@ -1,6 +1,14 @@
 import os
-import librosa
+import re
+import json
+import hashlib
+import tempfile
+import numpy as np
 import soundfile as sf
+import soxr
+from concurrent.futures import ProcessPoolExecutor
+from vad import FrameEnergy, split_energy
+from clip_pack import ClipPack, PackWriter, clip_stats, pack_paths
 
 # =====================
 # PATHS
@@ -10,8 +18,6 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 RAW_INPUT_DIR = os.path.join(BASE_DIR, "raw_input")
 OUTPUT_DIR = os.path.join(BASE_DIR, "output_clips")
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
 # =====================
 # AUDIO SETTINGS
 # =====================
@@ -21,74 +27,279 @@ SR = 22050
 TOP_DB = 20              # very sensitive silence detection
 MIN_CLIP_DURATION = 0.25 # seconds
 MERGE_GAP = 0.1          # split if silence >= 100ms
+HYSTERESIS_DB = 0        # stay in a clip until this many dB below the threshold (0 = off)
+
+# Energy frames (same as librosa.effects.split's defaults)
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
 
 SUPPORTED_EXTENSIONS = (".mp3", ".wav")
 
 # =====================
-# PROCESS FILES
+# PROCESSING SETTINGS
 # =====================
-print("Scanning raw_input folder...")
+BLOCK_SECONDS = 30  # Source audio decoded per step; bounds memory per worker
+MP3_PREROLL = 8 * 1152  # MPEG frames re-decoded before each block, then dropped
+MAX_WORKERS = None  # Files split in parallel (None = CPU count)
+MANIFEST_FILE = ".manifest.json"  # Sources already split, in OUTPUT_DIR
 
-files = [
-    f for f in os.listdir(RAW_INPUT_DIR)
-    if f.lower().endswith(SUPPORTED_EXTENSIONS)
-]
+# Clips go into one clip pack (OUTPUT_DIR/clips-<SR>.pcm + .json)
+PACK_DTYPE = "float32"  # float32 (zero-copy loads) or int16 (half the size)
+WRITE_MP3 = False  # Also write every clip as its own MP3, e.g. to sort into voices/ by hand
+MEASURE_LUFS = False  # Store each clip's integrated loudness (BS.1770) next to rms/peak/duration
 
-if not files:
-    print("No audio files found in raw_input/")
-    exit()
+# =====================
+# STREAMING DECODE
+# =====================
 
-clip_index = 0
+def iter_mono_blocks(path, sr, block_seconds=BLOCK_SECONDS):
+    """Decode ``path`` block by block as mono float32 resampled to ``sr``.
 
-for filename in files:
-    input_path = os.path.join(RAW_INPUT_DIR, filename)
-    base_name = os.path.splitext(filename)[0]
+    Same result as ``librosa.load(path, sr=sr)`` (mono mix, then soxr HQ
+    resampling), without ever holding the whole recording in memory.
+    libsndfile's MP3 decoder garbles the first few thousand samples after
+    each read boundary, so MP3 blocks are read from ``MP3_PREROLL``
+    samples earlier and the preroll is dropped.
+    """
+    with sf.SoundFile(path) as fh:
+        resampler = None
+        if fh.samplerate != sr:
+            resampler = soxr.ResampleStream(fh.samplerate, sr, 1, dtype="float32", quality="HQ")
+        step = int(block_seconds * fh.samplerate)
+        preroll = MP3_PREROLL if fh.format == "MP3" else 0
+        pos = 0
+        while True:
+            start = max(pos - preroll, 0)
+            if start != fh.tell():
+                fh.seek(start)
+            block = fh.read(pos - start + step, dtype="float32", always_2d=True)[pos - start :]
+            if not len(block):
+                break
+            pos += len(block)
+            mono = block.mean(axis=1)
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono)
+            if len(mono):
+                yield mono
+        if resampler is not None:
+            tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            if len(tail):
+                yield tail
 
-    print(f"\nProcessing: {filename}")
+# =====================
+# PER-FILE PASSES
+# =====================
 
-    audio, _ = librosa.load(input_path, sr=SR, mono=True)
+def detect_clips(input_path, spool_dir):
+    """Pass 1: decode once, spooling the PCM to disk and finding the clips.
 
-    # =====================
-    # VOICE ACTIVITY DETECTION
-    # =====================
-    intervals = librosa.effects.split(
-        audio,
-        top_db=TOP_DB
+    Returns ``(spool_path, chunks, clips, stats)``: the raw float32 spool
+    file (created in ``spool_dir``), the number of merged voice chunks,
+    the ``(start, end)`` clips long enough to keep, and each clip's
+    loudness stats for the pack index. Measuring happens here so it runs
+    in parallel, not in the single process that writes the pack.
+    """
+    energy = FrameEnergy(FRAME_LENGTH, HOP_LENGTH)
+    fd, spool_path = tempfile.mkstemp(dir=spool_dir, prefix=".split-", suffix=".f32")
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            for block in iter_mono_blocks(input_path, SR):
+                spool.write(block.tobytes())
+                energy.push(block)
+    except BaseException:
+        os.remove(spool_path)
+        raise
+
+    merged, clips = split_energy(
+        energy.finish(), energy.samples, SR, TOP_DB, MERGE_GAP, MIN_CLIP_DURATION, HYSTERESIS_DB, HOP_LENGTH
     )
+    clips = clips.tolist()
+    stats = []
+    try:
+        if clips:
+            audio = np.memmap(spool_path, dtype=np.float32, mode="r")
+            stats = [clip_stats(audio[start:end], SR, MEASURE_LUFS) for start, end in clips]
+            del audio
+    except BaseException:
+        os.remove(spool_path)
+        raise
+    return spool_path, len(merged), clips, stats
+
+def pack_clips(pack, spool_path, clips, stats, names, category):
+    """Pass 2: append each clip from the spool to the clip pack (a copy, no analysis)."""
+    if clips:
+        audio = np.memmap(spool_path, dtype=np.float32, mode="r")
+        for name, (start, end), measured in zip(names, clips, stats):
+            pack.add(name, category, audio[start:end], measured)
+        del audio
+
+def export_clips(spool_path, clips, names, out_dir):
+    """Write each clip from the spool as ``<name>.mp3``, then remove the spool."""
+    try:
+        if clips:
+            audio = np.memmap(spool_path, dtype=np.float32, mode="r")
+            for name, (start, end) in zip(names, clips):
+                sf.write(os.path.join(out_dir, f"{name}.mp3"), audio[start:end], SR, format="MP3")
+            del audio
+    finally:
+        os.remove(spool_path)
+
+# =====================
+# INGEST MANIFEST
+# =====================
 
-    # =====================
-    # MERGE CLOSE SEGMENTS
-    # =====================
-    merged = []
-    for start, end in intervals:
-        if not merged:
-            merged.append([start, end])
-            continue
+def split_params():
+    """Settings that change which clips a source produces."""
+    params = {
+        "sr": SR,
+        "top_db": TOP_DB,
+        "merge_gap": MERGE_GAP,
+        "min_clip_duration": MIN_CLIP_DURATION,
+        "frame_length": FRAME_LENGTH,
+        "hop_length": HOP_LENGTH,
+    }
+    if HYSTERESIS_DB:
+        # Only recorded when used, so enabling it is what triggers a re-split
+        params["hysteresis_db"] = HYSTERESIS_DB
+    return params
 
-        prev_start, prev_end = merged[-1]
-        gap = (start - prev_end) / SR
+def file_digest(path, chunk=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(chunk), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-        if gap <= MERGE_GAP:
-            merged[-1][1] = end
+def load_manifest(out_dir):
+    """The ingest manifest, or a fresh one numbered after any existing clips."""
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        pass
+    # Clips from runs before the manifest existed keep their numbers
+    pack = ClipPack.open(out_dir, SR)
+    names = os.listdir(out_dir) + [name for _, name in (pack.entries if pack else ())]
+    numbers = [int(m.group(1)) for m in map(re.compile(r"_clip_(\d+)(?:\.|$)").search, names) if m]
+    return {"next_index": max(numbers) + 1 if numbers else 0, "sources": {}}
+
+def save_manifest(out_dir, manifest):
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=MANIFEST_FILE, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.chmod(tmp_path, 0o644)  # mkstemp files are private to this user
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_FILE))
+
+def pending_sources(files, manifest, params):
+    """Names in ``files`` that are new, changed or split with other settings.
+
+    A source whose size and mtime match its entry is skipped without being
+    read; one that was only touched is hashed, found unchanged and has
+    its entry refreshed. Returns ``[(filename, source_info)]``.
+    """
+    pending = []
+    for filename in files:
+        path = os.path.join(RAW_INPUT_DIR, filename)
+        st = os.stat(path)
+        entry = manifest["sources"].get(filename)
+        if entry is not None and entry["params"] == params:
+            if (entry["size"], entry["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                continue
+            digest = file_digest(path)
+            if digest == entry["sha1"]:
+                entry["mtime_ns"] = st.st_mtime_ns
+                continue
         else:
-            merged.append([start, end])
+            digest = file_digest(path)
+        pending.append((filename, {"sha1": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}))
+    return pending
+
+def remove_clips(names, out_dir):
+    """Delete the MP3 copies of clips dropped from the pack."""
+    for name in names:
+        # Manifests from before the pack list the MP3 file names themselves
+        path = os.path.join(out_dir, name if name.endswith(".mp3") else f"{name}.mp3")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def split_files(files, max_workers=MAX_WORKERS):
+    """Split the new or changed ``files`` (names in ``RAW_INPUT_DIR``) on a process pool.
+
+    Sources recorded in the manifest with the same content and settings
+    are skipped. Files are detected in parallel; clip numbers continue
+    from the manifest's ``next_index`` and are handed out here in file
+    order, so they never depend on worker timing and are never reused.
+    Clips are appended to the clip pack here too (under their source's
+    name as category), so the pack has a single writer. A changed source
+    gets new numbers and its old clips are dropped. The pack and manifest
+    are saved after every file, so an interrupted run resumes.
+    Returns ``(sources split, clips written)``.
+    """
+    manifest = load_manifest(OUTPUT_DIR)
+    params = split_params()
+    pending = pending_sources(files, manifest, params)
+    save_manifest(OUTPUT_DIR, manifest)  # Keep refreshed mtimes even if nothing is pending
+    print(f"{len(files) - len(pending)} sources unchanged, {len(pending)} to split")
+
+    total = 0
+    with PackWriter(OUTPUT_DIR, SR, PACK_DTYPE) as pack, \
+            ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        detections = [
+            (filename, info, pool.submit(detect_clips, os.path.join(RAW_INPUT_DIR, filename), OUTPUT_DIR))
+            for filename, info in pending
+        ]
+        exports = []
+        for filename, info, future in detections:
+            spool_path, chunks, clips, stats = future.result()
+            print(f"{filename}: detected {chunks} voice chunks, keeping {len(clips)}")
+            base_name = os.path.splitext(filename)[0]
+            first_index = manifest["next_index"]
+            names = [f"{base_name}_clip_{first_index + i:04d}" for i in range(len(clips))]
+            manifest["next_index"] += len(clips)
+            save_manifest(OUTPUT_DIR, manifest)  # Numbers are spent even if packing fails
 
-    print(f"Detected {len(merged)} voice chunks")
+            try:
+                pack_clips(pack, spool_path, clips, stats, names, base_name)
+            except BaseException:
+                os.remove(spool_path)
+                raise
+            if WRITE_MP3:
+                exports.append(pool.submit(export_clips, spool_path, clips, names, OUTPUT_DIR))
+            else:
+                os.remove(spool_path)
 
-    # =====================
-    # EXPORT CLIPS
-    # =====================
-    for start, end in merged:
-        duration = (end - start) / SR
-        if duration < MIN_CLIP_DURATION:
-            continue
+            old = manifest["sources"].get(filename)
+            if old is not None:
+                pack.remove(set(old["clips"]) - set(names))
+            pack.save()
+            manifest["sources"][filename] = {**info, "params": params, "clips": names}
+            save_manifest(OUTPUT_DIR, manifest)
+            if old is not None:
+                remove_clips(set(old["clips"]) - set(names), OUTPUT_DIR)
+            total += len(names)
+        for future in exports:
+            future.result()
+    return len(pending), total
 
-        clip = audio[start:end]
+# =====================
+# PROCESS FILES
+# =====================
+
+if __name__ == "__main__":
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    print("Scanning raw_input folder...")
+
+    files = sorted(
+        f for f in os.listdir(RAW_INPUT_DIR)
+        if f.lower().endswith(SUPPORTED_EXTENSIONS)
+    )
 
-        output_name = f"{base_name}_clip_{clip_index:04d}.mp3"
-        output_path = os.path.join(OUTPUT_DIR, output_name)
+    if not files:
+        print("No audio files found in raw_input/")
+        raise SystemExit
 
-        sf.write(output_path, clip, SR, format="MP3")
-        clip_index += 1
+    split, clip_index = split_files(files)
 
-print(f"\n✅ Done! Exported {clip_index} clips to output_clips/")
\ No newline at end of file
+    print(f"\n✅ Done! Split {split} sources into {clip_index} clips in {os.path.basename(pack_paths(OUTPUT_DIR, SR)[0])}")
@@ -1,11 +1,14 @@
-import time
-import random
 import os
 import numpy as np
-import librosa
-import soundfile as sf
-import re
 from multiprocessing import Process
+from clip_library import ClipLibrary
+import pcm_cache
+from dsp import mix_looped_noise, ClipFX
+from output_naming import reserve_output, commit_output, discard_output
+from session_writer import write_audio
+from seeding import new_seed, job_rngs, spawn_seeds, seed_metadata
+from audio_formats import output_format
+from profiles import PROFILES
 
 # ==========================
 # BASE CONFIG
@@ -16,9 +19,15 @@ OUTPUT_ROOT = os.path.join(BASE_DIR, "output")
 
 # SR 16000 is excellent for mimicking Discord/VoIP quality
 SR = 16000 
+OUTPUT_FORMAT = "wav"  # Output codec: wav, flac (lossless), opus / vorbis / mp3 (low bitrate)
 
 user = "user1"
 
+VOICES_DIR = os.path.join(BASE_DIR, "voices_ai")
+# Served from voices_ai/clips-16000.pcm when packed (python clip_pack.py voices_ai --sr 16000)
+CLIPS = ClipLibrary(VOICES_DIR, SR)
+INTERRUPTS = ClipLibrary(VOICES_DIR, SR, extensions=(".mp3", ".wav"))
+
 # ==========================
 # 1. UPDATED ROUND LOGIC
 # ==========================
@@ -71,23 +80,22 @@ INTENSITY = {
 # 2. IMPROVED VOICE FX
 # ==========================
 
-def soften_voice(audio):
-    audio *= 0.9
-    return librosa.effects.preemphasis(audio, coef=0.85)
-
-def mic_color(audio):
-    # Mimics the frequency curve of a cheap headset
-    return librosa.effects.preemphasis(audio, coef=0.95)
-
-def simple_limiter(audio, threshold=0.8):
-    # Compresses loud peaks like a real gaming mic
-    return np.clip(audio, -threshold, threshold)
+# One fused pass per clip:
+# - Voice Softening: from the user's profile (g3ooorge: gain 0.9 + preemphasis 0.85)
+# - Mic colour: preemphasis 0.95 mimics the frequency curve of a cheap headset
+# - Limiter: clips loud peaks at 0.8 like a real gaming mic
+VOICE_FX = ClipFX(
+    preemphasis=0.95,
+    soften=PROFILES.get(user, {}).get("soften"),
+    limit=0.8,
+)
 
 # ==========================
 # CORE FUNCTIONS
 # ==========================
 
 def get_current_phase(elapsed):
+    # elapsed: seconds of audio rendered since the round started
     # Logic updated to prioritize the immediate start
     if elapsed < 15:
         return "early"
@@ -98,63 +106,49 @@ def get_current_phase(elapsed):
     return "end"
 
 def play_random_clip_from(source, state):
-    folder = os.path.join(BASE_DIR, "voices_ai", source)
-    if not os.path.exists(folder):
-        return
-
-    files = [f for f in os.listdir(folder) if f.endswith(".mp3")]
-    if not files:
+    rng = state["rng"]
+    picked = CLIPS.random_clip(source, rng)
+    if picked is None:
         return
 
-    file = random.choice(files)
-    audio, _ = librosa.load(os.path.join(folder, file), sr=SR)
+    clip = picked[1]
 
     # Calculate Energy
     base_intensity = INTENSITY.get(source, 0.4)
     state["energy"] = state["energy"] * 0.7 + base_intensity * 0.3
 
     # FX: Random Truncation (Releasing PTT too early)
-    if random.random() < 0.15:
-        audio = audio[: int(len(audio) * random.uniform(0.90, 0.98))]
-
-    # FX: Voice Softening
-    if user == "g3ooorge":
-        audio = soften_voice(audio)
+    if rng.random() < 0.15:
+        clip = clip[: int(len(clip) * rng.uniform(0.90, 0.98))]
 
     # FX: Fade out (Moving away from mic)
-    if random.random() < 0.20:
-        fade = np.linspace(1.0, random.uniform(0.7, 0.9), len(audio))
-        audio *= fade
+    fade_end = None
+    if rng.random() < 0.20:
+        fade_end = rng.uniform(0.7, 0.9)
 
     # Apply Gain based on Energy
-    gain_db = random.uniform(-1.0, 2.0) * state["energy"]
-    audio *= 10 ** (gain_db / 20)
+    gain_db = rng.uniform(-1.0, 2.0) * state["energy"]
 
-    # Apply Color and Limiting
-    audio = mic_color(audio)
-    audio = simple_limiter(audio)
+    # Softening, fade, gain, colour and limiting in one fused pass
+    audio = VOICE_FX.render(clip, np.empty(len(clip), dtype=np.float32), 10 ** (gain_db / 20), fade_end)
 
     state["audio"] = np.concatenate([state["audio"], audio])
 
 # NEW FEATURE: Interrupters (Keyboard clicks, coughs)
 def play_interrupter(state):
-    folder = os.path.join(BASE_DIR, "voices_ai", "interrupts")
-    if not os.path.exists(folder):
-        return # Skip if folder doesn't exist
-
-    files = [f for f in os.listdir(folder) if f.endswith(".mp3") or f.endswith(".wav")]
+    rng = state["rng"]
+    files = INTERRUPTS.files("interrupts")
     if not files:
-        return
+        return # Skip if folder doesn't exist or is empty
 
     # Only play interrupter occasionally (5% chance per silence block)
-    if random.random() > 0.05:
+    if rng.random() > 0.05:
         return
 
-    file = random.choice(files)
-    audio, _ = librosa.load(os.path.join(folder, file), sr=SR)
+    file = rng.choice(files)
     
     # Make interrupters quiet (background noise)
-    audio *= 0.15 
+    audio = INTERRUPTS.load("interrupts", file) * 0.15
     state["audio"] = np.concatenate([state["audio"], audio])
 
 def add_silence(seconds, state):
@@ -164,83 +158,86 @@ def add_silence(seconds, state):
     silence = np.zeros(int(seconds * SR))
     state["audio"] = np.concatenate([state["audio"], silence])
 
-def mix_background_noise(speech, bg_noise, base_level=0.012):
+def mix_background_noise(speech, bg_noise, rng, base_level=0.012):
     noise_path = os.path.join(BASE_DIR, "voices_ai", "bg_noise", f"{bg_noise}.mp3")
     if not os.path.exists(noise_path):
         print(f"Warning: Bg noise {bg_noise} not found.")
         return speech
 
-    noise, _ = librosa.load(noise_path, sr=SR)
-
-    # Loop noise to match speech length
-    if len(noise) < len(speech):
-        noise = np.tile(noise, int(np.ceil(len(speech) / len(noise))))
-    noise = noise[: len(speech)]
+    # Memory-mapped from the PCM cache; looped and mixed one block at a time
+    noise, _ = pcm_cache.load(noise_path, SR, mmap=True)
 
     # IMPROVEMENT: Dynamic Noise Level
     # This makes the fan noise "breathe" slightly, so it's not a static loop
     # It mimics the user moving slightly in their chair
-    dynamic_level = np.linspace(base_level, base_level * random.uniform(0.8, 1.2), len(speech))
-    
-    return speech + (noise * dynamic_level)
+    end_level = base_level * rng.uniform(0.8, 1.2)
+
+    return mix_looped_noise(speech, noise, base_level, end_level=end_level)
 
 # ==========================
 # ROUND GENERATION
 # ==========================
 
 def generate_round(state):
+    rng = state["rng"]
     # Reset energy slightly at start of round
-    state["energy"] = random.uniform(0.5, 0.8)
-    start = time.time()
+    state["energy"] = rng.uniform(0.5, 0.8)
+    # Phases follow rendered audio time, not how fast this machine renders
+    round_start = len(state["audio"])
 
     for source in ROUND_SEQUENCE:
-        phase = get_current_phase(time.time() - start)
+        phase = get_current_phase((len(state["audio"]) - round_start) / SR)
 
         # Check Logic Rules
         if source not in PHASE_RULES[phase]:
             continue
-        if random.random() > PLAY_PROBABILITY[source]:
+        if rng.random() > PLAY_PROBABILITY[source]:
             continue
 
         # Random hesitation before speaking
-        if random.random() < 0.15:
-            add_silence(random.uniform(0.2, 0.8), state)
+        if rng.random() < 0.15:
+            add_silence(rng.uniform(0.2, 0.8), state)
 
         play_random_clip_from(source, state)
 
         # Post-speech pause logic
-        r = random.random()
+        r = rng.random()
         if r < 0.5:
             # Micro pause
-            pause = random.uniform(0.1, 0.4)
+            pause = rng.uniform(0.1, 0.4)
         elif r < 0.85:
             # Conversational pause
-            pause = random.uniform(0.5, 1.5)
+            pause = rng.uniform(0.5, 1.5)
         else:
             # Long "focusing on game" pause
-            pause = random.uniform(3.0, 7.0)
+            pause = rng.uniform(3.0, 7.0)
 
         add_silence(pause, state)
 
     # Long break between rounds
-    add_silence(random.uniform(2.0, 5.0), state)
+    add_silence(rng.uniform(2.0, 5.0), state)
 
 # ==========================
 # AUDIO JOB
 # ==========================
 
-def generate_audio_job(bg_noise, version):
+def generate_audio_job(bg_noise, version, seed=None):
+    if seed is None:
+        seed = new_seed()
+    rng, _ = job_rngs(seed)
+
     state = {
         "audio": np.array([], dtype=np.float32),
         "energy": 0.5,
+        "rng": rng,
     }
 
     # Generate roughly 1 Hour 20 Mins of audio + Random extra
     BASE_SECONDS = 1 * 3600 + 20 * 60
-    EXTRA_SECONDS = random.randint(5 * 60, 15 * 60)
+    EXTRA_SECONDS = rng.randint(5 * 60, 15 * 60)
     TARGET_SECONDS = BASE_SECONDS + EXTRA_SECONDS
 
-    print(f"[JOB START] {bg_noise} v{version} - Target: {TARGET_SECONDS/60:.1f} mins")
+    print(f"[JOB START] {bg_noise} v{version} seed={seed} - Target: {TARGET_SECONDS/60:.1f} mins")
 
     while len(state["audio"]) / SR < TARGET_SECONDS:
         generate_round(state)
@@ -254,7 +251,7 @@ def generate_audio_job(bg_noise, version):
 
     # Add Environment
     if bg_noise != "none":
-        audio = mix_background_noise(audio, bg_noise)
+        audio = mix_background_noise(audio, bg_noise, rng)
 
     # Final Safety Normalize
     peak = np.max(np.abs(audio))
@@ -265,19 +262,14 @@ def generate_audio_job(bg_noise, version):
     out_dir = os.path.join(OUTPUT_ROOT, bg_noise)
     os.makedirs(out_dir, exist_ok=True)
 
-    files = os.listdir(out_dir)
-    numbers = []
-    for file in files:
-        match = re.search(r'\d+', file)
-        if match:
-            numbers.append(int(match.group()))
-
-    file_name = 1
-    if numbers:
-        file_name = max(numbers) + 1
-
-    out_path = os.path.join(out_dir, f"{file_name}.wav")
-    sf.write(out_path, audio, SR)
+    format, subtype, ext = output_format(OUTPUT_FORMAT, SR)
+    out_path, part_path = reserve_output(out_dir, ext=ext, start=1)
+    try:
+        write_audio(part_path, audio, SR, format=format, subtype=subtype, metadata=seed_metadata(seed, user=user, bg_noise=bg_noise))
+        commit_output(part_path, out_path)
+    except BaseException:
+        discard_output(part_path)
+        raise
 
     print(f"[JOB DONE] Saved to: {out_path}")
 
@@ -285,9 +277,9 @@ def generate_audio_job(bg_noise, version):
 # PARALLEL RUNNER
 # ==========================
 
-def run_bg_noise_job(bg_noise, audios_to_add):
-    for v in range(1, audios_to_add + 1):
-        generate_audio_job(bg_noise, v)
+def run_bg_noise_job(bg_noise, audios_to_add, seeds):
+    for v, seed in zip(range(1, audios_to_add + 1), seeds):
+        generate_audio_job(bg_noise, v, seed)
 
 # ==========================
 # MAIN
@@ -299,15 +291,18 @@ if __name__ == "__main__":
     
     bg_noises = ["none"]
     audios_to_add = 1
+    run_seed = None  # Set to reproduce a previous run
 
     processes = []
 
     print("Starting Generation...")
 
-    for bg in bg_noises:
+    seeds = spawn_seeds(run_seed, len(bg_noises) * audios_to_add)
+
+    for i, bg in enumerate(bg_noises):
         p = Process(
             target=run_bg_noise_job,
-            args=(bg, audios_to_add)
+            args=(bg, audios_to_add, seeds[i * audios_to_add : (i + 1) * audios_to_add])
         )
         p.start()
         processes.append(p)
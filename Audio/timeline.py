@@ -0,0 +1,62 @@
+import numpy as np
+
+# ==========================
+# TIMELINE BUFFER
+# ==========================
+
+class Timeline:
+    """Append-only float32 audio buffer.
+
+    Replaces the ``np.concatenate`` pattern: the buffer is preallocated
+    (usually from the target duration) and grows geometrically if a render
+    overshoots, so appending is amortized O(len(chunk)).
+    """
+
+    def __init__(self, capacity=0):
+        self._buf = np.zeros(max(int(capacity), 1), dtype=np.float32)
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def _reserve(self, samples):
+        needed = self._len + samples
+        if needed <= len(self._buf):
+            return
+        capacity = max(needed, int(len(self._buf) * 1.5))
+        grown = np.zeros(capacity, dtype=np.float32)
+        grown[: self._len] = self._buf[: self._len]
+        self._buf = grown
+
+    def append(self, audio):
+        samples = len(audio)
+        self._reserve(samples)
+        self._buf[self._len : self._len + samples] = audio
+        self._len += samples
+
+    def claim(self, samples):
+        """Append ``samples`` samples and return them as a writable view.
+
+        Lets an FX chain render straight into the timeline. The view is only
+        valid until the next append.
+        """
+        samples = int(samples)
+        self._reserve(samples)
+        view = self._buf[self._len : self._len + samples]
+        self._len += samples
+        return view
+
+    def append_silence(self, samples):
+        # The buffer is zero-filled past the cursor, so silence is free.
+        samples = int(samples)
+        self._reserve(samples)
+        self._len += samples
+
+    def to_array(self):
+        """Return the rendered audio as a view (no copy)."""
+        return self._buf[: self._len]
+
+    def clear(self):
+        """Empty the timeline, keeping its allocation for the next round."""
+        self._buf[: self._len] = 0
+        self._len = 0
@@ -0,0 +1,134 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ==========================
+# ENERGY-BASED VOICE DETECTION
+# ==========================
+
+FRAME_LENGTH = 2048  # Same framing as librosa.effects.split / trim
+HOP_LENGTH = 512
+AMIN = 1e-10  # Energy floor before taking dB
+
+def frame_energy(audio, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH, center=True):
+    """Mean-square energy per frame, like ``librosa.feature.rms(...) ** 2``.
+
+    Frames are strided views of the (zero-padded when ``center``) signal,
+    so nothing is copied into a frame matrix.
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if center:
+        pad = frame_length // 2
+        audio = np.pad(audio, (pad, pad))
+    if len(audio) < frame_length:
+        return np.zeros(0)
+    frames = sliding_window_view(audio, frame_length)[::hop_length]
+    return np.einsum("ij,ij->i", frames, frames).astype(np.float64) / frame_length
+
+class FrameEnergy:
+    """``frame_energy`` of a stream fed one block at a time.
+
+    Samples of a frame that straddles a block boundary are carried over,
+    so the result is the same as for the whole signal at once.
+    """
+
+    def __init__(self, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.samples = 0
+        self._carry = np.zeros(frame_length // 2, dtype=np.float32)  # Centre padding
+        self._frames = []
+
+    def _consume(self, x):
+        n = 0 if len(x) < self.frame_length else 1 + (len(x) - self.frame_length) // self.hop_length
+        if n:
+            self._frames.append(frame_energy(x[: (n - 1) * self.hop_length + self.frame_length],
+                                             self.frame_length, self.hop_length, center=False))
+        self._carry = x[n * self.hop_length :]
+
+    def push(self, audio):
+        self.samples += len(audio)
+        self._consume(np.concatenate([self._carry, audio.astype(np.float32, copy=False)]))
+
+    def finish(self):
+        """Energies of every frame (``1 + samples // hop_length`` of them)."""
+        self._consume(np.concatenate([self._carry, np.zeros(self.frame_length // 2, dtype=np.float32)]))
+        frames = np.concatenate(self._frames) if self._frames else np.zeros(0)
+        return frames[: 1 + self.samples // self.hop_length]
+
+def to_db(energy):
+    """Frame energies in dB relative to the loudest frame."""
+    return 10 * np.log10(np.maximum(energy, AMIN)) - 10 * np.log10(max(energy.max(), AMIN))
+
+def voiced_frames(db, top_db, hysteresis_db=0.0):
+    """Boolean voice mask with threshold hysteresis.
+
+    A frame turns voice on above ``-top_db`` and only turns it off again
+    below ``-(top_db + hysteresis_db)``; frames in between keep the state
+    of the last frame that crossed either threshold. With no hysteresis
+    this is the plain ``db > -top_db`` test of ``librosa.effects.split``.
+    """
+    on = db > -top_db
+    if hysteresis_db <= 0:
+        return on
+    off = db < -(top_db + hysteresis_db)
+    decided = on | off
+    last = np.maximum.accumulate(np.where(decided, np.arange(len(db)), -1))
+    return np.where(last >= 0, on[np.maximum(last, 0)], False)
+
+def mask_to_intervals(mask, samples, hop_length=HOP_LENGTH):
+    """``[start, end)`` sample intervals of the runs of ``True`` frames."""
+    if len(mask) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    edges = np.flatnonzero(np.diff(mask.astype(np.int8))) + 1
+    if mask[0]:
+        edges = np.concatenate([[0], edges])
+    if mask[-1]:
+        edges = np.concatenate([edges, [len(mask)]])
+    edges = np.minimum(edges * hop_length, samples)
+    return edges.reshape(-1, 2).astype(np.int64)
+
+def merge_intervals(intervals, sr, merge_gap):
+    """Join intervals separated by at most ``merge_gap`` seconds."""
+    if len(intervals) < 2:
+        return np.asarray(intervals, dtype=np.int64).reshape(-1, 2)
+    gaps = (intervals[1:, 0] - intervals[:-1, 1]) / sr
+    breaks = np.flatnonzero(gaps > merge_gap)
+    starts = intervals[np.concatenate([[0], breaks + 1]), 0]
+    ends = intervals[np.concatenate([breaks, [len(intervals) - 1]]), 1]
+    return np.stack([starts, ends], axis=1)
+
+def drop_short(intervals, sr, min_duration):
+    """Intervals lasting at least ``min_duration`` seconds."""
+    return intervals[(intervals[:, 1] - intervals[:, 0]) / sr >= min_duration]
+
+def split_energy(energy, samples, sr, top_db, merge_gap=0.0, min_duration=0.0,
+                 hysteresis_db=0.0, hop_length=HOP_LENGTH):
+    """Voice intervals from precomputed frame energies.
+
+    Returns ``(merged, kept)``: every merged interval, and those long
+    enough to keep.
+    """
+    if len(energy) == 0:
+        empty = np.zeros((0, 2), dtype=np.int64)
+        return empty, empty
+    mask = voiced_frames(to_db(energy), top_db, hysteresis_db)
+    merged = merge_intervals(mask_to_intervals(mask, samples, hop_length), sr, merge_gap)
+    return merged, drop_short(merged, sr, min_duration)
+
+def split(audio, sr, top_db=60, merge_gap=0.0, min_duration=0.0, hysteresis_db=0.0,
+          frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """Voice intervals of an in-memory signal (``librosa.effects.split`` plus merging)."""
+    energy = frame_energy(audio, frame_length, hop_length)
+    return split_energy(energy, len(audio), sr, top_db, merge_gap, min_duration, hysteresis_db, hop_length)[1]
+
+def trim(audio, top_db=60, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """``audio`` without leading and trailing silence (a view, like ``librosa.effects.trim``)."""
+    energy = frame_energy(audio, frame_length, hop_length)
+    if len(energy) == 0:
+        return audio
+    voiced = np.flatnonzero(to_db(energy) > -top_db)
+    if len(voiced) == 0:
+        return audio[:0]
+    start = voiced[0] * hop_length
+    end = min(len(audio), (voiced[-1] + 1) * hop_length)
+    return audio[start:end]
@@ -1,30 +1,199 @@
-from flask import Flask, render_template, send_file, request
-from background_runner import run_generator_async
-import subprocess
+from flask import Flask, Response, render_template, request
+from background_runner import RenderPool
+from job_registry import JobRegistry
+from audio_serving import send_audio
 import os
+import sys
+import json
+import time
 import uuid
+import fnmatch
+import itertools
 import threading
-import random
 
 app = Flask(__name__)
+# Let nginx/Apache send audio bodies themselves (X-Sendfile) when deployed behind one
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE") == "1"
 
 # ===== PATH SETUP =====
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
 AUDIO_DIR = os.path.join(BASE_DIR, "Audio")
 OUTPUT_DIR = os.path.join(AUDIO_DIR, "output")
-GENERATOR_SCRIPT = os.path.join(AUDIO_DIR, "main.py")
+TRANSCODE_DIR = os.path.join(OUTPUT_DIR, ".transcoded")  # Compressed variants of rendered files
+TRANSCODE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Disk budget for those variants (2 GB, least recently served go first)
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-USER_MAPPING = {
-    "botfrag666": "none",
-    "elooo2092": "white_noise",
-    "echogreg": "fan",
-    "kooooalaid": "none",
-    "g3ooorge": "white_noise"
+# Codec table shared with the generator
+if AUDIO_DIR not in sys.path:
+    sys.path.append(AUDIO_DIR)
+from audio_formats import AUDIO_EXTENSIONS, OUTPUT_FORMATS, mimetype_for
+from profiles import noise_mapping
+from transcode import TranscodeCache, negotiate_variant
+from catalog import OutputCatalog
+from session_pool import SessionPool
+
+transcoded = TranscodeCache(TRANSCODE_DIR, max_bytes=TRANSCODE_MAX_BYTES)
+catalog = OutputCatalog(OUTPUT_DIR, AUDIO_EXTENSIONS)
+
+# ===== AUDIO LISTS =====
+PAGE_SIZE = 50  # /user_audios entries per page by default
+MAX_PAGE_SIZE = 500
+
+# ===== RENDER POOL =====
+RENDER_WORKERS = 2  # Sessions rendered at the same time
+RENDER_QUEUE_LIMIT = 8  # Extra jobs allowed to wait; beyond this /generate returns 503
+RETRY_AFTER_SECONDS = 30
+SSE_KEEPALIVE_SECONDS = 15  # Comment line sent on idle event streams
+STREAM_CHUNK_BYTES = 16 * 1024  # Live preview bytes sent per read
+STREAM_POLL_SECONDS = 0.25  # Wait between reads while the next round renders
+LIVE_FILE_TTL_SECONDS = 10 * 60  # Live previews are deleted this long after a job ends
+STALE_FILE_SECONDS = 60 * 60  # Scratch files untouched this long were left by a dead process
+SWEEP_INTERVAL_SECONDS = 30 * 60  # How often output/ is checked for them
+
+# ===== SESSION POOL =====
+SESSION_STOCK = 2  # Unserved sessions kept ready per noise profile
+SERVE_ONCE = True  # /random_audio hands each session out only once
+REFILL_INTERVAL_SECONDS = 60  # How often stock is checked besides after each pick
+REFILL_IDLE_LOAD = 0.5  # Refill only below this 1-minute load average per CPU
+
+jobs = JobRegistry(max_active=RENDER_WORKERS + RENDER_QUEUE_LIMIT)
+render_pool = None
+session_pool = None
+pools_lock = threading.RLock()  # Concurrent first requests must not each start a pool
+
+def on_render_event(job_id, event, value):
+    if event == "running":
+        jobs.start(job_id)
+    elif event == "progress":
+        jobs.progress(job_id, value)
+
+def remove_later(path, delay):
+    def remove():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    timer = threading.Timer(delay, remove)
+    timer.daemon = True
+    timer.start()
+
+def sweep_stale_files(max_age=STALE_FILE_SECONDS):
+    """Delete scratch files that a restart, a dead worker or an encode left behind.
+
+    Live previews (``.<job>.live.wav``) and render scratch files
+    (``.session-*.f32``) in the output folders, and half-written variants
+    (``.*.part``) in the transcode cache. Files still being written are
+    touched every round or block, so only ones idle for ``max_age`` go.
+    """
+    folders = [(OUTPUT_DIR, (".*.live.wav", ".session-*.f32")), (TRANSCODE_DIR, (".*.part",))]
+    with os.scandir(OUTPUT_DIR) as entries:
+        folders += [
+            (entry.path, (".session-*.f32",))
+            for entry in entries
+            if entry.is_dir() and entry.path != TRANSCODE_DIR
+        ]
+    cutoff = time.time() - max_age
+    for folder, patterns in folders:
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            continue
+        for entry in entries:
+            if not any(fnmatch.fnmatch(entry.name, pattern) for pattern in patterns):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+def sweep_forever():
+    while True:
+        try:
+            sweep_stale_files()
+        except Exception as exc:
+            print(f"[SWEEP] failed: {exc!r}")
+        time.sleep(SWEEP_INTERVAL_SECONDS)
+
+def on_job_finished(job_id, future):
+    jobs.finish(job_id, future)
+    job = jobs.get(job_id)
+    if job["status"] == "done":
+        catalog.add(job["path"])
+    live_path = job.get("live_path")
+    if live_path:
+        # Listeners that are still streaming keep their open handle
+        remove_later(live_path, LIVE_FILE_TTL_SECONDS)
+
+def get_render_pool():
+    global render_pool
+    with pools_lock:
+        if render_pool is None:
+            render_pool = RenderPool(AUDIO_DIR, RENDER_WORKERS, on_event=on_render_event)
+            render_pool.warm()
+        return render_pool
+
+def submit_refill(folder):
+    # Rendered with the profile of a user who draws from this folder, taking
+    # turns when several share it; numbered into output/<folder>/ like a CLI
+    # run, in the generator's OUTPUT_FORMAT
+    user = next(refill_users[folder])
+    return get_render_pool().submit(f"refill-{uuid.uuid4().hex}", bg_noise=folder, user=user)
+
+def get_session_pool():
+    global session_pool
+    with pools_lock:
+        if session_pool is None:
+            session_pool = SessionPool(
+                catalog,
+                sorted(set(USER_MAPPING.values())),
+                SESSION_STOCK,
+                os.path.join(OUTPUT_DIR, ".served.log"),
+                submit=submit_refill,
+                is_busy=lambda: jobs.active() > 0,
+                serve_once=SERVE_ONCE,
+                interval=REFILL_INTERVAL_SECONDS,
+                idle_load=REFILL_IDLE_LOAD,
+            )
+            session_pool.start()
+        return session_pool
+
+# Leftovers from before this start are swept now, later ones as they go stale
+threading.Thread(target=sweep_forever, daemon=True).start()
+
+# user -> output folder (their noise bed), from Audio/profiles.py
+USER_MAPPING = noise_mapping()
+# Noise beds a /generate request may ask for
+BG_NOISES = set(USER_MAPPING.values()) | {"none"}
+# folder -> endless turns over the users served from it
+refill_users = {
+    folder: itertools.cycle(sorted(user for user, bg in USER_MAPPING.items() if bg == folder))
+    for folder in set(USER_MAPPING.values())
 }
 
+def serve_audio(path):
+    """Send a rendered file, or a compressed variant the client asked for.
+
+    Variants are encoded in the background; until one is cached the
+    original file is sent, so playback never waits for an encode.
+    """
+    try:
+        variant = negotiate_variant(request.accept_mimetypes, request.args.get("format"))
+    except ValueError as exc:
+        return {"error": str(exc)}, 400
+    cached = transcoded.get(path, variant) if variant is not None else None
+    if cached is not None:
+        path = cached
+        mimetype = OUTPUT_FORMATS[variant][3]
+    else:
+        mimetype = mimetype_for(path)
+    response = send_audio(path, mimetype=mimetype)
+    response.vary.add("Accept")
+    return response
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -33,47 +202,140 @@ def index():
 def generate():
     data = request.get_json()
 
-    user = data.get("user", "user1")
-    bg_noise = data.get("bg_noise", "none")
-
-    effects = data.get("effects", {})
-    dog_howl = str(effects.get("dog_howl", False))
-    car_horn = str(effects.get("car_horn", False))
+    user = data.get("user")
+    if user is not None and user not in USER_MAPPING:
+        return {"error": "Invalid user"}, 400
+    # Any warm worker renders any user: the profile is applied per job
+    bg_noise = data.get("bg_noise") or USER_MAPPING.get(user, "none")
+    if bg_noise not in BG_NOISES:
+        return {"error": "Invalid bg_noise"}, 400
+    stream = bool(data.get("stream", False))
 
     job_id = uuid.uuid4().hex
     filename = f"{job_id}.wav"
     output_path = os.path.join(OUTPUT_DIR, filename)
+    live_path = os.path.join(OUTPUT_DIR, f".{job_id}.live.wav") if stream else None
 
-    # run audio generator
-    args = [
-            "python",
-            GENERATOR_SCRIPT,
-            output_path,
-            user,
-            bg_noise,
-            dog_howl,
-            car_horn
-        ]
+    if jobs.create(job_id, user=user, bg_noise=bg_noise, live_path=live_path) is None:
+        return (
+            {"status": "busy", "error": "Render queue is full, try again later"},
+            503,
+            {"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
 
-    threading.Thread(
-        target=run_generator_async,
-        args=(args,),
-        daemon=True
-    ).start()
-    
-    return {
+    # render in a warm worker process
+    try:
+        future = get_render_pool().submit(
+            job_id,
+            bg_noise=bg_noise,
+            user=user,
+            version=job_id,
+            out_path=output_path,
+            codec="wav",  # Compressed variants are made on request, see serve_audio
+            live_path=live_path,
+        )
+    except Exception as exc:
+        # Frees the queue slot and ends any /events stream for the job
+        jobs.fail(job_id, f"Could not start render: {exc!r}")
+        return {"status": "failed", "job_id": job_id, "error": "Could not start the render"}, 500
+    future.add_done_callback(lambda f: on_job_finished(job_id, f))
+
+    response = {
         "status": "started",
         "job_id": job_id,
         "audio_url": f"/audio/{job_id}"
     }
+    if stream:
+        response["stream_url"] = f"/stream/{job_id}"
+    return response
+
+@app.route("/stream/<job_id>")
+def stream_audio(job_id):
+    """Play a session while it renders: tails the job's live preview WAV."""
+    job = jobs.get(job_id)
+    if job is None or not job.get("live_path"):
+        return {"error": "No live stream for this job"}, 404
+    live_path = job["live_path"]
+
+    def follow():
+        # The worker creates the file when it picks the job up
+        while not os.path.exists(live_path):
+            current = jobs.get(job_id)
+            if current is None or current["status"] in ("done", "failed"):
+                return
+            time.sleep(STREAM_POLL_SECONDS)
+
+        with open(live_path, "rb") as fh:
+            while True:
+                data = fh.read(STREAM_CHUNK_BYTES)
+                if data:
+                    yield data
+                    continue
+                current = jobs.get(job_id)
+                if current is None or current["status"] in ("done", "failed"):
+                    # The preview is closed before the job finishes; drain it
+                    rest = fh.read()
+                    if rest:
+                        yield rest
+                    return
+                time.sleep(STREAM_POLL_SECONDS)
+
+    return Response(follow(), mimetype="audio/wav", headers={"Cache-Control": "no-cache"})
+
+@app.route("/jobs/<job_id>")
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return {"error": "Unknown job"}, 404
+    return job
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/events/<job_id>")
+def job_events(job_id):
+    """Server-sent events for one job: ``progress`` updates, then ``ready`` or ``failed``."""
+    if jobs.get(job_id) is None:
+        return {"error": "Unknown job"}, 404
+
+    def stream():
+        last = None
+        while True:
+            job = jobs.wait(job_id, last, timeout=SSE_KEEPALIVE_SECONDS)
+            if job is None:
+                yield sse("failed", {"error": "Unknown job"})
+                return
+            if job == last:
+                yield ": keepalive\n\n"
+                continue
+            last = job
+
+            if job["status"] == "done":
+                yield sse("ready", {"audio_url": f"/audio/{job_id}"})
+                return
+            if job["status"] == "failed":
+                yield sse("failed", {"error": job["error"]})
+                return
+            yield sse("progress", {"status": job["status"], "progress": job["progress"]})
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.route("/audio/<job_id>")
 def get_audio(job_id):
     path = os.path.join(OUTPUT_DIR, f"{job_id}.wav")
+    job = jobs.get(job_id)
+    if job is not None and job["status"] == "failed":
+        return {"status": "failed", "error": job["error"]}, 500
     if not os.path.exists(path):
-        return {"status": "processing"}, 202
+        if job is None:
+            return {"error": "Unknown job"}, 404
+        return {"status": job["status"], "progress": job["progress"]}, 202
 
-    return send_file(path, mimetype="audio/wav")
+    return serve_audio(path)
 
 @app.route("/random_audio", methods=["POST"])
 def random_audio():
@@ -82,38 +344,52 @@ def random_audio():
     if not user or user not in USER_MAPPING:
         return {"error": "Invalid user"}, 400
     folder = USER_MAPPING[user]
-    folder_path = os.path.join(OUTPUT_DIR, folder)
-    if not os.path.exists(folder_path):
+    if not catalog.exists(folder):
         return {"error": f"Folder {folder} not found"}, 404
-    files = [f for f in os.listdir(folder_path) if f.endswith('.wav')]
-    if not files:
+    # Served from pre-rendered stock; the pool refills it in the background
+    chosen, fresh = get_session_pool().take(folder)
+    if chosen is None and SERVE_ONCE:
+        # Every session was handed out already; the refill renders a new one
+        return (
+            {"status": "busy", "error": "No unheard session ready yet, try again later"},
+            503,
+            {"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    if chosen is None:
         return {"error": f"No audios in {folder}"}, 404
-    chosen = random.choice(files)
-    return {"filename": f"{folder}/{chosen}"}
+    return {"filename": f"{folder}/{chosen}", "fresh": fresh}
 
 @app.route("/user_audios/<user>")
 def get_user_audios(user):
     if not user or user not in USER_MAPPING:
         return {"error": "Invalid user"}, 400
     folder = USER_MAPPING[user]
-    folder_path = os.path.join(OUTPUT_DIR, folder)
-    if not os.path.exists(folder_path):
-        return {"audios": []}
-    files = [f for f in os.listdir(folder_path) if f.endswith('.wav')]
-    # Sort by number in filename
-    import re
-    files.sort(key=lambda x: int(re.search(r'\d+', x).group()) if re.search(r'\d+', x) else 0)
-    return {"audios": files, "folder": folder}
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    offset = (page - 1) * per_page
+    items = catalog.page(folder, offset, per_page)
+    return {
+        "audios": [item["name"] for item in items],
+        "items": items,
+        "folder": folder,
+        "page": page,
+        "per_page": per_page,
+        "total": catalog.count(folder),
+    }
 
 @app.route("/audio_file/<path:filepath>")
 def get_audio_file(filepath):
-    full_path = os.path.join(OUTPUT_DIR, filepath)
-    if not os.path.exists(full_path):
-        return {"error": "File not found"}, 404
-    # Ensure it's within OUTPUT_DIR
-    if not os.path.abspath(full_path).startswith(os.path.abspath(OUTPUT_DIR)):
+    full_path = os.path.abspath(os.path.join(OUTPUT_DIR, filepath))
+    # Ensure it's within OUTPUT_DIR (checked before touching the filesystem)
+    if not full_path.startswith(os.path.abspath(OUTPUT_DIR) + os.sep):
         return {"error": "Invalid path"}, 400
-    return send_file(full_path, mimetype="audio/wav")
+    if not os.path.isfile(full_path):
+        return {"error": "File not found"}, 404
+    return serve_audio(full_path)
 
 if __name__ == "__main__":
+    # Under the debug reloader only the serving child should own workers
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        get_render_pool()
+        get_session_pool()
     app.run(host="0.0.0.0", port=3000, debug=True)
@@ -0,0 +1,38 @@
+import os
+from flask import send_file
+
+# ==========================
+# AUDIO FILE SERVING
+# ==========================
+
+AUDIO_MAX_AGE = 24 * 3600  # Rendered files never change once published
+
+def file_meta(path):
+    """``(etag, last_modified, size)`` for a file, from one ``os.stat``.
+
+    The ETag is built from the mtime and size, so a replaced file gets a
+    new one without ever hashing its contents.
+    """
+    st = os.stat(path)
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}", st.st_mtime, st.st_size
+
+def send_audio(path, mimetype="audio/wav", max_age=AUDIO_MAX_AGE):
+    """Serve an audio file with Range, ETag and Last-Modified support.
+
+    Werkzeug answers ``Range`` with 206 partial content and
+    ``If-None-Match`` / ``If-Modified-Since`` with 304. The body goes
+    through ``wsgi.file_wrapper`` (``sendfile`` on servers such as
+    gunicorn), or is handed to the front server entirely when the app has
+    ``USE_X_SENDFILE`` set.
+    """
+    etag, last_modified, _ = file_meta(path)
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        conditional=True,
+        etag=etag,
+        last_modified=last_modified,
+        max_age=max_age,
+    )
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
@@ -1,7 +1,129 @@
-import threading
-import subprocess
-import uuid
 import os
+import sys
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# ==========================
+# WARM RENDER WORKERS
+# ==========================
+
+generator = None  # Audio/main.py, imported once per worker
+_events = None  # Queue of (job_id, event, value) back to the web process
+
+def _init_worker(audio_dir, events):
+    """Import the generator, decode the clip library and compile every profile once per worker."""
+    global generator, _events
+    _events = events
+    if audio_dir not in sys.path:
+        sys.path.insert(0, audio_dir)
+    import main as generator
+    generator.CLIPS.preload(set(generator.ROUND_SEQUENCE))
+    for user in generator.PROFILES:
+        generator.render_plan(user)  # Every user's plan is ready before the first job
+
+PROGRESS_STEP = 0.01  # Forward progress in 1% steps, not once per round
+
+def _render(job_id, job):
+    reported = [0.0]
+
+    def progress(fraction):
+        if fraction - reported[0] >= PROGRESS_STEP or fraction >= 1.0:
+            reported[0] = fraction
+            _events.put((job_id, "progress", fraction))
+
+    _events.put((job_id, "running", None))
+    return generator.generate_audio_job(progress=progress, **job)
+
+def _ping():
+    return os.getpid()
+
+class RenderPool:
+    """Long-lived generator processes that render jobs in-process.
+
+    Replaces one ``python main.py`` subprocess per request. Workers import
+    librosa and load the clip library once at startup, so a job starts
+    rendering immediately. At most ``max_workers`` jobs run at a time;
+    the rest wait in the executor's queue. Workers report ``running`` and
+    ``progress`` events, which a listener thread passes to ``on_event``.
+
+    If a worker dies (OOM kill, segfault, failed import) the executor is
+    broken for good: every job queued or running on it fails with
+    ``BrokenProcessPool``, and the next submit replaces it with a fresh,
+    warmed executor instead of failing forever.
+    """
+
+    def __init__(self, audio_dir, max_workers=None, on_event=None):
+        self.audio_dir = audio_dir
+        self.max_workers = max_workers or os.cpu_count()
+        # Forking a threaded web server is unsafe; start workers clean
+        self._ctx = multiprocessing.get_context("spawn")
+        self._on_event = on_event
+        self._lock = threading.Lock()
+        self._events = None
+        self._executor = self._start()
+
+    def _start(self):
+        # A dead worker may have died mid-write to the old queue, so every
+        # executor gets its own; the old listener is told to stop.
+        if self._events is not None:
+            self._events.put(None)
+        self._events = self._ctx.Queue()
+        threading.Thread(target=self._listen, args=(self._events,), daemon=True).start()
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._ctx,
+            initializer=_init_worker,
+            initargs=(self.audio_dir, self._events),
+        )
+
+    def _listen(self, events):
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            job_id, event, value = item
+            if self._on_event is not None:
+                self._on_event(job_id, event, value)
+
+    def _replace(self, broken):
+        """Swap in a new executor if ``broken`` is still the current one."""
+        with self._lock:
+            if self._executor is not broken:
+                return self._executor
+            print("[RENDER POOL] worker died; starting a new pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._start()
+            executor = self._executor
+        self.warm()
+        return executor
+
+    def _watch(self, executor, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._replace(executor)
+
+    def warm(self):
+        """Start every worker now instead of on the first requests."""
+        with self._lock:
+            executor = self._executor
+        try:
+            return [executor.submit(_ping) for _ in range(self.max_workers)]
+        except BrokenProcessPool:
+            return []  # Replaced on the next submit
+
+    def submit(self, job_id, **job):
+        """Queue ``main.generate_audio_job(**job)``; returns a Future."""
+        with self._lock:
+            executor = self._executor
+        try:
+            future = executor.submit(_render, job_id, job)
+        except BrokenProcessPool:
+            executor = self._replace(executor)
+            future = executor.submit(_render, job_id, job)
+        future.add_done_callback(lambda f: self._watch(executor, f))
+        return future
 
-def run_generator_async(args):
-    subprocess.run(args, check=True)
\ No newline at end of file
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
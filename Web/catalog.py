@@ -0,0 +1,142 @@
+import os
+import re
+import time
+import bisect
+import random
+import threading
+import soundfile as sf
+from audio_formats import mimetype_for
+
+# ==========================
+# OUTPUT CATALOG
+# ==========================
+
+RACY_SECONDS = 2  # Folders changed this recently are re-listed (coarse mtime clocks)
+
+_number = re.compile(r"\d+")
+
+def sort_key(name):
+    """Order sessions by the first number in their name, as the UI always has."""
+    match = _number.search(name)
+    return (int(match.group()) if match else 0, name)
+
+class OutputCatalog:
+    """Sorted, paginated index of the rendered sessions in each output folder.
+
+    A folder is listed and sorted once, then reused until its mtime
+    changes, so a request costs one ``os.stat`` plus the page it returns.
+    Folders modified within ``RACY_SECONDS`` are not trusted yet: on file
+    systems with coarse timestamps a second file written in the same tick
+    would leave the mtime unchanged. ``add`` inserts a file the app has
+    just published without waiting for a re-list. Duration and size are
+    read lazily, only for entries that end up on a page.
+    """
+
+    def __init__(self, root, extensions):
+        self.root = root
+        self.extensions = tuple(extensions)
+        self._folders = {}  # folder -> {"mtime_ns", "trusted", "generation", "entries": [(key, name)]}
+        self._meta = {}  # path -> ((mtime_ns, size), meta)
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Call ``callback(folder, name)`` for every file passed to ``add``."""
+        self._listeners.append(callback)
+
+    def _listed(self, name):
+        return not name.startswith(".") and name.endswith(self.extensions)
+
+    def _folder(self, folder):
+        path = os.path.join(self.root, folder)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._folders.get(folder)
+            if cached is not None and cached["mtime_ns"] == mtime_ns and cached["trusted"]:
+                return cached["entries"]
+
+        entries = sorted(
+            (sort_key(entry.name), entry.name)
+            for entry in os.scandir(path)
+            if self._listed(entry.name) and entry.is_file()
+        )
+        trusted = time.time_ns() - mtime_ns > RACY_SECONDS * 1_000_000_000
+        with self._lock:
+            generation = cached["generation"] if cached is not None else 0
+            if cached is None or cached["entries"] != entries:
+                generation += 1  # Changed behind our back (not through add)
+            self._folders[folder] = {"mtime_ns": mtime_ns, "trusted": trusted, "generation": generation, "entries": entries}
+        return entries
+
+    def generation(self, folder):
+        """Bumped whenever a re-list finds files that didn't come through ``add``."""
+        if self._folder(folder) is None:
+            return None
+        with self._lock:
+            return self._folders[folder]["generation"]
+
+    def add(self, path):
+        """Record a file that was just published under ``root``."""
+        folder, name = os.path.split(os.path.relpath(path, self.root))
+        if not self._listed(name):
+            return
+        with self._lock:
+            cached = self._folders.get(folder)
+            if cached is not None:
+                item = (sort_key(name), name)
+                index = bisect.bisect_left(cached["entries"], item)
+                if index == len(cached["entries"]) or cached["entries"][index] != item:
+                    # Copy on write: pages already handed out keep their list
+                    cached["entries"] = cached["entries"][:index] + [item] + cached["entries"][index:]
+            # Otherwise it is listed in full on first use
+        for callback in self._listeners:
+            callback(folder, name)
+
+    def exists(self, folder):
+        return self._folder(folder) is not None
+
+    def count(self, folder):
+        entries = self._folder(folder)
+        return len(entries) if entries else 0
+
+    def names(self, folder, offset=0, limit=None):
+        """File names in ``folder`` in display order, optionally one page of them."""
+        entries = self._folder(folder) or []
+        stop = len(entries) if limit is None else offset + limit
+        return [name for _, name in entries[offset:stop]]
+
+    def choice(self, folder, rng=random):
+        """A random file name from ``folder``, or ``None`` if it is empty."""
+        entries = self._folder(folder)
+        return rng.choice(entries)[1] if entries else None
+
+    def meta(self, folder, name):
+        """``{"name", "size", "duration", "mimetype"}`` for one file, cached per (mtime, size)."""
+        path = os.path.join(self.root, folder, name)
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._meta.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            duration = round(sf.info(path).duration, 2)
+        except RuntimeError:
+            duration = None  # Unreadable or still being replaced
+        meta = {"name": name, "size": st.st_size, "duration": duration, "mimetype": mimetype_for(name)}
+        with self._lock:
+            self._meta[path] = (key, meta)
+        return meta
+
+    def page(self, folder, offset, limit):
+        """Metadata for one page of ``folder``; files removed meanwhile are skipped."""
+        items = []
+        for name in self.names(folder, offset, limit):
+            try:
+                items.append(self.meta(folder, name))
+            except FileNotFoundError:
+                continue
+        return items
@@ -0,0 +1,108 @@
+import time
+import threading
+
+# ==========================
+# RENDER JOB REGISTRY
+# ==========================
+
+ACTIVE_STATUSES = ("queued", "running")
+
+class JobRegistry:
+    """In-memory record of render jobs: status, progress and timings.
+
+    Status goes ``queued`` -> ``running`` -> ``done`` / ``failed``. At most
+    ``max_active`` jobs may be queued or running; ``create`` refuses
+    anything past that, so a burst of requests can't pile up dozens of
+    90-minute renders. Only the newest ``history`` finished jobs are kept.
+    ``wait`` lets push endpoints block until a job changes instead of
+    polling.
+    """
+
+    def __init__(self, max_active, history=500):
+        self.max_active = max_active
+        self.history = history
+        self._jobs = {}
+        self._finished = []
+        self._lock = threading.Condition()
+
+    def _active(self):
+        return sum(1 for job in self._jobs.values() if job["status"] in ACTIVE_STATUSES)
+
+    def active(self):
+        """Number of jobs queued or running."""
+        with self._lock:
+            return self._active()
+
+    def create(self, job_id, **info):
+        """Register a queued job, or return ``None`` if the queue is full."""
+        with self._lock:
+            if self._active() >= self.max_active:
+                return None
+            job = {
+                "job_id": job_id,
+                "status": "queued",
+                "progress": 0.0,
+                "error": None,
+                "path": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                **info,
+            }
+            self._jobs[job_id] = job
+            self._lock.notify_all()
+            return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait(self, job_id, last=None, timeout=None):
+        """Block until the job's record differs from ``last`` (or timeout).
+
+        Returns the current record, or ``None`` if the job is unknown.
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: self._jobs.get(job_id) != last, timeout)
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _update(self, job_id, **changes):
+        # Worker events arrive asynchronously and may trail the final
+        # outcome; never let them reopen a finished job.
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] in ACTIVE_STATUSES:
+                job.update(changes)
+                self._lock.notify_all()
+
+    def start(self, job_id):
+        self._update(job_id, status="running", started_at=time.time())
+
+    def progress(self, job_id, fraction):
+        self._update(job_id, progress=round(float(fraction), 4))
+
+    def finish(self, job_id, future):
+        """Record the outcome of a job's Future (use as a done-callback)."""
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error is not None:
+            self.fail(job_id, "cancelled" if error is None else repr(error))
+        else:
+            self._close(job_id, status="done", progress=1.0, path=future.result())
+
+    def fail(self, job_id, error):
+        """Mark a job failed, e.g. one that never reached a worker."""
+        self._close(job_id, status="failed", error=error)
+
+    def _close(self, job_id, **outcome):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["finished_at"] = time.time()
+            job.update(outcome)
+            self._finished.append(job_id)
+            self._lock.notify_all()
+            while len(self._finished) > self.history:
+                self._jobs.pop(self._finished.pop(0), None)
@@ -0,0 +1,181 @@
+import os
+import random
+import threading
+
+# ==========================
+# PRE-RENDERED SESSION STOCK
+# ==========================
+
+COMPACT_FACTOR = 2  # Rewrite the served log once it has this many lines per live entry
+
+class SessionPool:
+    """Keeps ``stock`` unserved sessions ready in each noise profile folder.
+
+    ``take`` hands out a session nobody has been given yet and appends it
+    to ``served_path`` (one ``folder/name`` per line, so restarts don't
+    re-serve), then wakes the refill thread. The unserved sessions of
+    each folder are kept as a set, updated by ``take`` and by the
+    catalog's ``add``, so a pick costs O(1) plus one appended line; a
+    folder is only re-scanned when the catalog re-lists it with files
+    that appeared behind the app's back. Refills go through
+    ``submit(folder)``, which must return a Future resolving to the new
+    file's path. They start only while the machine is idle: ``is_busy()``
+    is false and the 1-minute load average per CPU is under
+    ``idle_load``. At most ``max_pending`` refills run at once, so user
+    renders always keep a worker. When a folder has no fresh stock left,
+    ``take`` returns nothing with ``serve_once`` (the caller asks the
+    client to come back once a refill lands) and falls back to any
+    session without it.
+    """
+
+    def __init__(self, catalog, folders, stock, served_path, submit, is_busy,
+                 serve_once=True, interval=60, idle_load=0.5, max_pending=1):
+        self.catalog = catalog
+        self.folders = list(folders)
+        self.stock = stock
+        self.served_path = served_path
+        self.serve_once = serve_once
+        self.interval = interval
+        self.idle_load = idle_load
+        self.max_pending = max_pending
+        self._submit = submit
+        self._is_busy = is_busy
+        self._pending = {}  # folder -> Future of the refill rendering for it
+        self._served, self._log_lines = self._load_served()
+        self._fresh = {}  # folder -> (catalog generation, [unserved names], {name: index})
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        catalog.subscribe(self._added)
+
+    def _load_served(self):
+        served = {}
+        lines = 0
+        try:
+            with open(self.served_path) as fh:
+                for line in fh:
+                    folder, _, name = line.rstrip("\n").partition("/")
+                    if name:
+                        served.setdefault(folder, set()).add(name)
+                        lines += 1
+        except OSError:
+            pass
+        return served, lines
+
+    def _log_served(self, folder, name):
+        # Called with the lock held
+        with open(self.served_path, "a") as fh:
+            fh.write(f"{folder}/{name}\n")
+        self._log_lines += 1
+        live = sum(len(names) for names in self._served.values())
+        if self._log_lines > COMPACT_FACTOR * max(live, 1) + 100:
+            self._compact()
+
+    def _compact(self):
+        # Rewrite the log without duplicates or files that no longer exist
+        lines = []
+        for folder, names in self._served.items():
+            names &= set(self.catalog.names(folder))
+            lines.extend(f"{folder}/{name}\n" for name in sorted(names))
+        tmp_path = f"{self.served_path}.tmp"
+        with open(tmp_path, "w") as fh:
+            fh.writelines(lines)
+        os.replace(tmp_path, self.served_path)
+        self._log_lines = len(lines)
+
+    def _stock(self, folder):
+        # Called with the lock held; rebuilt only after an outside change
+        generation = self.catalog.generation(folder)
+        cached = self._fresh.get(folder)
+        if cached is None or cached[0] != generation:
+            served = self._served.get(folder, set())
+            names = [name for name in self.catalog.names(folder) if name not in served]
+            cached = (generation, names, {name: i for i, name in enumerate(names)})
+            self._fresh[folder] = cached
+        return cached[1], cached[2]
+
+    def _added(self, folder, name):
+        with self._lock:
+            cached = self._fresh.get(folder)
+            if cached is None or name in cached[2] or name in self._served.get(folder, ()):
+                return
+            cached[2][name] = len(cached[1])
+            cached[1].append(name)
+
+    def unserved(self, folder):
+        with self._lock:
+            return len(self._stock(folder)[0])
+
+    def take(self, folder, rng=random):
+        """``(name, fresh)`` for a session from ``folder``, or ``(None, False)``.
+
+        With ``serve_once`` only fresh sessions are handed out, so
+        ``(None, False)`` also means the stock is used up for now.
+        """
+        with self._lock:
+            names, index = self._stock(folder)
+            fresh = bool(names)
+            if fresh:
+                name = rng.choice(names)
+                if self.serve_once:
+                    # Swap-remove keeps this O(1)
+                    i = index.pop(name)
+                    last = names.pop()
+                    if last != name:
+                        names[i] = last
+                        index[last] = i
+                    self._served.setdefault(folder, set()).add(name)
+                    self._log_served(folder, name)
+            elif self.serve_once:
+                name = None
+            else:
+                name = self.catalog.choice(folder, rng)
+        self._wake.set()
+        return name, fresh
+
+    def _idle(self):
+        if self._is_busy():
+            return False
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return True  # No load average on this platform (Windows)
+        return load < self.idle_load
+
+    def _refilled(self, folder, future):
+        with self._lock:
+            self._pending.pop(folder, None)
+        if not future.cancelled() and future.exception() is None:
+            self.catalog.add(future.result())
+        self._wake.set()
+
+    def refill(self):
+        """Start renders for folders below their stock, while idle."""
+        for folder in self.folders:
+            with self._lock:
+                if folder in self._pending or len(self._pending) >= self.max_pending:
+                    continue
+            if self.unserved(folder) >= self.stock:
+                continue
+            if not self._idle():
+                return
+            future = self._submit(folder)
+            with self._lock:
+                self._pending[folder] = future
+            future.add_done_callback(lambda f, folder=folder: self._refilled(folder, f))
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.refill()
+            except Exception as exc:
+                print(f"[SESSION POOL] refill failed: {exc!r}")
+
+    def start(self):
+        """Check stock now and then every ``interval`` seconds in the background."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            self._wake.set()
@@ -0,0 +1,147 @@
+import os
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import soundfile as sf
+from audio_formats import OUTPUT_FORMATS, OPUS_RATES, output_format
+
+# ==========================
+# COMPRESSED VARIANTS
+# ==========================
+
+TRANSCODE_BLOCK = 1 << 16  # Frames decoded/encoded per step
+SERVED_VARIANTS = ("opus", "flac")  # Offered via Accept, smallest first
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Cached variants kept on disk (2 GB)
+
+def negotiate_variant(accept_mimetypes, requested=None):
+    """Variant to serve: ``?format=`` wins, else the first type the client lists.
+
+    Only types named explicitly in ``Accept`` count; ``*/*`` and
+    ``audio/*`` get the original file, since not every browser plays Ogg.
+    Returns ``None`` for the original file. The variant is only a
+    preference: it is served once ``TranscodeCache`` has it.
+    """
+    if requested:
+        requested = requested.lower()
+        if requested in ("wav", "original"):
+            return None
+        if requested not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown format {requested!r}")
+        return requested
+    listed = {value for value, quality in accept_mimetypes if quality > 0}
+    for variant in SERVED_VARIANTS:
+        if OUTPUT_FORMATS[variant][3] in listed:
+            return variant
+    return None
+
+class TranscodeCache:
+    """Compressed copies of rendered files, encoded in the background.
+
+    ``get`` never encodes on the request thread: it returns the cached
+    entry if there is one, and otherwise queues the encode and returns
+    ``None`` so the caller can send the original file right away. Entries
+    live in ``cache_dir`` as
+    ``<hash of source path>-<hash of mtime/size>-<variant><ext>``, so a
+    re-rendered source gets a fresh entry and the stale one is removed.
+    Encoding streams the source block by block into a temp file that is
+    renamed into place. Entries are kept under ``max_bytes``, evicting
+    the least recently served first.
+    """
+
+    def __init__(self, cache_dir, block=TRANSCODE_BLOCK, max_bytes=DEFAULT_MAX_BYTES, workers=1):
+        self.cache_dir = cache_dir
+        self.block = block
+        self.max_bytes = max_bytes
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcode")
+
+    def _entry(self, source, variant):
+        st = os.stat(source)
+        source_key = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:16]
+        version = hashlib.sha1(f"{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()[:12]
+        ext = OUTPUT_FORMATS[variant][2]
+        return source_key, os.path.join(self.cache_dir, f"{source_key}-{version}-{variant}{ext}")
+
+    def _drop_stale(self, source_key, variant, keep):
+        suffix = f"-{variant}{OUTPUT_FORMATS[variant][2]}"
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(source_key + "-") and name.endswith(suffix) and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _evict(self, keep):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or path == keep:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries) + os.path.getsize(keep)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def _encode(self, source, path, variant):
+        with sf.SoundFile(source) as src:
+            if variant == "opus" and src.samplerate not in OPUS_RATES:
+                variant = "vorbis"  # Same container and mimetype, any sample rate
+            format, subtype, _ = output_format(variant)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".", suffix=".part")
+            os.close(fd)
+            try:
+                with sf.SoundFile(tmp_path, "w", src.samplerate, src.channels, format=format, subtype=subtype) as out:
+                    if src.comment:
+                        out.comment = src.comment  # Keeps the render seed
+                    for block in src.blocks(self.block, dtype="float32"):
+                        out.write(block)
+                os.chmod(tmp_path, 0o644)  # mkstemp files are private to this user
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+    def _run(self, source, source_key, path, variant):
+        try:
+            self._encode(source, path, variant)
+            self._drop_stale(source_key, variant, keep=path)
+            self._evict(keep=path)
+        except Exception as exc:
+            print(f"[TRANSCODE] {source} -> {variant} failed: {exc!r}")
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+
+    def get(self, source, variant):
+        """Path of ``source`` as ``variant`` if it is cached, else ``None``.
+
+        A missing entry is queued for encoding, so a later request gets it.
+        """
+        if os.path.splitext(source)[1].lower() == OUTPUT_FORMATS[variant][2]:
+            return source  # Already in that format
+        os.makedirs(self.cache_dir, exist_ok=True)
+        source_key, path = self._entry(source, variant)
+        try:
+            os.utime(path)  # Recently served entries are evicted last
+            return path
+        except OSError:
+            pass
+        with self._lock:
+            if path in self._pending:
+                return None
+            self._pending.add(path)
+        self._executor.submit(self._run, source, source_key, path, variant)
+        return None